@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Measure the throughput of execute_actions and Command scheduling (POSTPROCESS) using the stub tools
+#
+# Usage: execute_actions.py [--files=<n>] [--jobs=<n>,...] [--latency=<s>] [--output-lines=<n>] [--failure-rate=<p>] [--workers=<n>]
+# Every run works on a freshly generated library since the actions modify it.
+# With --workers, conversions run on that many local queue workers (see rename_images/JobQueue.py) instead.
+import getopt
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_library
+
+STUBS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubs')
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'renameimages.py')
+
+# Prepare and execute postprocessing of directory with limit jobs per resource class, conversions on queue workers if given
+def run_postprocess(directory, jobs, queue = None):
+	import gi
+	gi.require_version('Gtk', '4.0')
+	from rename_images import Annotations, Batch, Config, ConsoleProgress, Mode
+	properties = dict(Mode.POSTPROCESS, limits = {'cpu': jobs, 'io': jobs})
+	if queue: properties['queue'] = queue
+	batch = Batch.Batch([directory])
+	batch.init(properties, ConsoleProgress.ConsoleProgress(None))
+	Annotations.run_until_complete(batch.prepare())
+	actions = sum([len(files) for check in batch._file_actions.values() for files in check.values()])
+	start = time.perf_counter()
+	error = None
+	try:
+		Annotations.run_until_complete(batch.execute())
+	except Exception as e:
+		error = str(e)
+	seconds = time.perf_counter() - start
+	with open(os.path.join(Config.get_data_dir('reports'), '%s.json' % batch._run_id)) as f:
+		phases = [phase for phase in json.load(f)['phases'] if phase['name'].startswith('execute_actions:')]
+	return {'jobs': jobs, 'actions': actions, 'execute': seconds, 'actions_per_second': actions / seconds if seconds > 0 else None, 'error': error, 'phases': phases}
+
+def syntax():
+	print('Syntax: %s [--files=<n>] [--jobs=<n>,...] [--latency=<s>] [--output-lines=<n>] [--failure-rate=<p>] [--workers=<n>]' % sys.argv[0])
+	sys.exit(1)
+
+def main():
+	if len(sys.argv) in [4, 5] and sys.argv[1] == '--child':
+		print(json.dumps(run_postprocess(sys.argv[2], int(sys.argv[3]), sys.argv[4] if len(sys.argv) == 5 else None)))
+		return
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], '', ['files=', 'jobs=', 'latency=', 'output-lines=', 'failure-rate=', 'workers='])
+		options = dict(opts)
+		files = int(options.get('--files', 500))
+		jobs = [int(value) for value in options.get('--jobs', '1,2,4,8').split(',')]
+		workers = int(options.get('--workers', 0))
+	except (getopt.GetoptError, ValueError):
+		syntax()
+	if args: syntax()
+	env = dict(os.environ, RENAME_IMAGES_TOOL_DIR = STUBS, STUB_SEED = '0',
+		STUB_LATENCY = options.get('--latency', '0.05'),
+		STUB_OUTPUT_LINES = options.get('--output-lines', '20'),
+		STUB_FAILURE_RATE = options.get('--failure-rate', '0'))
+	for limit in jobs:
+		directory = tempfile.mkdtemp()
+		queue = tempfile.mkdtemp() if workers else None
+		processes = [subprocess.Popen([sys.executable, MAIN, '--worker=' + queue], env = env, stderr = subprocess.DEVNULL) for index in range(workers)]
+		try:
+			generate_library.Library(directory, files = files, rotated_share = 0.5).generate()
+			output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', directory, str(limit)] + ([queue] if queue else []), env = env)
+			result = json.loads(output.decode('utf-8').splitlines()[-1])
+		finally:
+			for process in processes: process.terminate()
+			for process in processes: process.wait()
+			shutil.rmtree(directory)
+			if queue: shutil.rmtree(queue)
+		print('%2d jobs: %d actions in %.3fs (%.1f actions/s)%s' % (limit, result['actions'], result['execute'], result['actions_per_second'] or 0, ', ' + result['error'] if result['error'] else ''))
+		for phase in result['phases']:
+			print('         %-32s %8.3fs, step latency p50 %.2fms, p99 %.2fms' % (phase['name'], phase['wall_seconds'], phase['latency_ms']['p50'], phase['latency_ms']['p99']))
+
+if __name__ == '__main__':
+	main()
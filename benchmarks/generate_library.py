@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Generate a synthetic, reproducible photo library for benchmarks
+#
+# Usage: generate_library.py [options] <directory>
+#   --files=<n>            number of files (default 1000)
+#   --per-directory=<n>    files per event directory (default 200)
+#   --seed=<n>             random seed (default 0)
+#   --raw-share=<p>        share of shots with a RAW file next to the JPEG (default 0.3)
+#   --orphan-share=<p>     share of RAW-only shots (default 0.05)
+#   --set-share=<p>        share of HDR/panorama sets "(a)", "(b)", ... (default 0.1)
+#   --video-share=<p>      share of videos (default 0.05)
+#   --rotated-share=<p>    share of images with an orientation other than 1 (default 0.2)
+#   --size=<w>x<h>         pixel size of the JPEGs (default 64x48)
+import datetime
+import getopt
+import json
+import os
+import random
+import struct
+import sys
+
+# Orientations of rotated images (EXIF values)
+ROTATIONS = [3, 6, 8]
+# RAW formats and the camera making them
+RAWS = [('.cr2', 'Canon', 'Canon EOS 5D Mark IV'), ('.nef', 'NIKON CORPORATION', 'NIKON D850')]
+# TIFF field types
+ASCII = 2
+SHORT = 3
+LONG = 4
+# TIFF/EXIF tags
+TAG_WIDTH = 0x0100
+TAG_HEIGHT = 0x0101
+TAG_BITS_PER_SAMPLE = 0x0102
+TAG_COMPRESSION = 0x0103
+TAG_PHOTOMETRIC = 0x0106
+TAG_STRIP_OFFSETS = 0x0111
+TAG_SAMPLES_PER_PIXEL = 0x0115
+TAG_ROWS_PER_STRIP = 0x0116
+TAG_STRIP_BYTE_COUNTS = 0x0117
+TAG_MAKE = 0x010f
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+EXIF_TIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+# Version of the generated content (libraries of other versions are regenerated by run.py)
+LIBRARY_FORMAT = 2
+# Tags of HDR/panorama sets (as assigned by the rename modes)
+SET_TAGS = ['Panorama', 'HDR']
+# Seconds between 1904-01-01 (QuickTime epoch) and 1970-01-01
+QUICKTIME_EPOCH = 2082844800
+
+# Encode a little-endian TIFF IFD located at offset; values not fitting into an entry follow the IFD
+def build_ifd(entries, offset, next_ifd = 0):
+	size = 2 + 12 * len(entries) + 4
+	header = struct.pack('<H', len(entries))
+	data = b''
+	for tag, type, value in sorted(entries):
+		if type == ASCII:
+			value = value.encode('ascii') + b'\0'
+			count = len(value)
+			if count <= 4:
+				field = value.ljust(4, b'\0')
+			else:
+				field = struct.pack('<I', offset + size + len(data))
+				data += value + (b'\0' if len(value) % 2 else b'')
+		elif type == SHORT:
+			count = 1
+			field = struct.pack('<HH', value, 0)
+		else:
+			count = 1
+			field = struct.pack('<I', value)
+		header += struct.pack('<HHI', tag, type, count) + field
+	return header + struct.pack('<I', next_ifd) + data
+
+# Encode a TIFF structure with IFD0 and an EXIF IFD; prefix is inserted after the TIFF header (e.g. the CR2 header)
+# size: (width, height) of a grey 8 bit image stored after the IFDs (None: metadata only)
+def build_tiff(ifd0, exif, prefix = b'', size = None):
+	offset = 8 + len(prefix)
+	ifd0 = ifd0 + [(TAG_EXIF_IFD, LONG, 0)]
+	strip = b''
+	if size is not None:
+		width, height = size
+		strip = bytes([128]) * (width * height)
+		ifd0 += [(TAG_WIDTH, LONG, width), (TAG_HEIGHT, LONG, height), (TAG_BITS_PER_SAMPLE, SHORT, 8), (TAG_COMPRESSION, SHORT, 1), (TAG_PHOTOMETRIC, SHORT, 1),
+			(TAG_SAMPLES_PER_PIXEL, SHORT, 1), (TAG_ROWS_PER_STRIP, LONG, height), (TAG_STRIP_BYTE_COUNTS, LONG, len(strip)), (TAG_STRIP_OFFSETS, LONG, 0)]
+	# IFD sizes do not depend on the values of the pointers, so they can be filled in afterwards
+	exif_offset = offset + len(build_ifd(ifd0, offset))
+	strip_offset = exif_offset + len(build_ifd(exif, exif_offset))
+	ifd0 = [(tag, type, exif_offset if tag == TAG_EXIF_IFD else strip_offset if tag == TAG_STRIP_OFFSETS else value) for tag, type, value in ifd0]
+	return b'II*\0' + struct.pack('<I', offset) + prefix + build_ifd(ifd0, offset) + build_ifd(exif, exif_offset) + strip
+
+# Get IFD entries for an image taken at time
+def get_tiff_entries(time, orientation, make = None, model = None):
+	text = time.strftime(EXIF_TIME_FORMAT)
+	ifd0 = [(TAG_ORIENTATION, SHORT, orientation), (TAG_DATETIME, ASCII, text)]
+	if make is not None: ifd0 += [(TAG_MAKE, ASCII, make), (TAG_MODEL, ASCII, model)]
+	exif = [(TAG_DATETIME_ORIGINAL, ASCII, text), (TAG_DATETIME_DIGITIZED, ASCII, text)]
+	return ifd0, exif
+
+# Encode a JPEG marker segment
+def segment(marker, payload):
+	return struct.pack('>BBH', 0xff, marker, len(payload) + 2) + payload
+
+# Encode a valid baseline grayscale JPEG with EXIF and XMP (optionally with a keyword); every 8x8 block is plain grey
+def build_jpeg(time, orientation, width, height, tag = None):
+	ifd0, exif = get_tiff_entries(time, orientation)
+	subject = '<dc:subject><rdf:Bag><rdf:li>%s</rdf:li></rdf:Bag></dc:subject>' % tag if tag else ''
+	xmp = ('<?xpacket begin="" id="W5M0MpCehiHzreSzNTczkc9d"?><x:xmpmeta xmlns:x="adobe:ns:meta/">'
+		'<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"><rdf:Description rdf:about=""'
+		' xmlns:tiff="http://ns.adobe.com/tiff/1.0/" xmlns:xmp="http://ns.adobe.com/xap/1.0/" xmlns:dc="http://purl.org/dc/elements/1.1/"'
+		' tiff:Orientation="%d" xmp:CreateDate="%s">%s</rdf:Description></rdf:RDF></x:xmpmeta><?xpacket end="w"?>') % (orientation, time.isoformat(), subject)
+	# Huffman tables with a single code "0": DC difference category 0 and AC end of block
+	huffman = bytes([1] + [0] * 15) + b'\0'
+	blocks = ((width + 7) // 8) * ((height + 7) // 8)
+	bits = 2 * blocks
+	scan = bytearray((bits + 7) // 8)
+	if bits % 8: scan[-1] = (1 << (8 - bits % 8)) - 1
+	return (b'\xff\xd8'
+		+ segment(0xe1, b'Exif\0\0' + build_tiff(ifd0, exif))
+		+ segment(0xe1, b'http://ns.adobe.com/xap/1.0/\0' + xmp.encode('utf-8'))
+		+ segment(0xdb, b'\0' + bytes([1] * 64))
+		+ segment(0xc0, struct.pack('>BHHBBBB', 8, height, width, 1, 1, 0x11, 0))
+		+ segment(0xc4, b'\x00' + huffman)
+		+ segment(0xc4, b'\x10' + huffman)
+		+ segment(0xda, b'\x01\x01\x00\x00\x3f\x00')
+		+ bytes(scan) + b'\xff\xd9')
+
+# Encode a TIFF stub of a RAW file (CR2 or NEF) with EXIF
+def build_raw(time, orientation, extension, make, model):
+	ifd0, exif = get_tiff_entries(time, orientation, make, model)
+	prefix = b'CR\x02\0\0\0\0\0' if extension == '.cr2' else b''
+	return build_tiff(ifd0, exif, prefix, (8, 8))
+
+# Encode an ISO base media atom
+def atom(type, payload):
+	return struct.pack('>I', 8 + len(payload)) + type + payload
+
+# Encode a MOV/MP4 stub with an mvhd atom containing creation time and duration
+def build_video(time, extension):
+	seconds = int(time.replace(tzinfo = datetime.timezone.utc).timestamp()) + QUICKTIME_EPOCH
+	brand = b'qt  ' if extension == '.mov' else b'isom'
+	matrix = struct.pack('>9I', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+	mvhd = struct.pack('>IIIII', 0, seconds, seconds, 1000, 10000) + struct.pack('>IH', 0x10000, 0x100) + bytes(10) + matrix + bytes(24) + struct.pack('>I', 2)
+	return atom(b'ftyp', brand + struct.pack('>I', 0) + brand) + atom(b'moov', atom(b'mvhd', mvhd)) + atom(b'mdat', bytes(64))
+
+# Generator of a synthetic library
+class Library:
+	def __init__(self, directory, files = 1000, per_directory = 200, seed = 0, raw_share = 0.3, orphan_share = 0.05, set_share = 0.1, video_share = 0.05, rotated_share = 0.2, size = (64, 48)):
+		self._directory = directory
+		self._files = files
+		self._per_directory = per_directory
+		self._seed = seed
+		self._shares = {'raw': raw_share, 'orphan': orphan_share, 'set': set_share, 'video': video_share, 'rotated': rotated_share}
+		self._size = size
+		self._random = random.Random(seed)
+		self._counts = {}
+
+	# Get description of the library (stored next to it to allow reuse)
+	def get_parameters(self):
+		return {'format': LIBRARY_FORMAT, 'files': self._files, 'per_directory': self._per_directory, 'seed': self._seed, 'shares': self._shares, 'size': list(self._size)}
+
+	# Write file and set its modification time to the time it was taken
+	def write(self, path, data, time, kind):
+		with open(path, 'wb') as f:
+			f.write(data)
+		stamp = time.timestamp()
+		os.utime(path, (stamp, stamp))
+		self._counts[kind] = self._counts.get(kind, 0) + 1
+
+	# Get random orientation
+	def get_orientation(self):
+		if self._random.random() < self._shares['rotated']: return self._random.choice(ROTATIONS)
+		return 1
+
+	# Write one shot (image with optional RAW, RAW-only, HDR/panorama set or video); returns number of files
+	def write_shot(self, directory, index, time):
+		name = os.path.join(directory, 'IMG_%04d' % (index % 10000))
+		choice = self._random.random()
+		if choice < self._shares['video']:
+			extension = self._random.choice(['.mov', '.mp4'])
+			self.write(name + extension, build_video(time, extension), time, 'video')
+			return 1
+		choice -= self._shares['video']
+		if choice < self._shares['orphan']:
+			extension, make, model = self._random.choice(RAWS)
+			self.write(name + extension, build_raw(time, self.get_orientation(), extension, make, model), time, 'orphan')
+			return 1
+		choice -= self._shares['orphan']
+		if choice < self._shares['set']:
+			count = self._random.randint(3, 5)
+			tag = self._random.choice(SET_TAGS)
+			for position in range(count):
+				shot = time + datetime.timedelta(seconds = position)
+				self.write('%s(%s).jpg' % (name, chr(ord('a') + position)), build_jpeg(shot, 1, *self._size, tag), shot, 'set')
+			return count
+		orientation = self.get_orientation()
+		self.write(name + '.jpg', build_jpeg(time, orientation, *self._size), time, 'jpeg')
+		if self._random.random() < self._shares['raw']:
+			extension, make, model = self._random.choice(RAWS)
+			self.write(name + extension, build_raw(time, orientation, extension, make, model), time, 'raw')
+			return 2
+		return 1
+
+	# Generate the library; returns the number of files per kind
+	def generate(self):
+		time = datetime.datetime(2015, 1, 1, 8, 0, 0)
+		written = 0
+		event = 0
+		while written < self._files:
+			event += 1
+			time = time + datetime.timedelta(days = self._random.randint(1, 20))
+			directory = os.path.join(self._directory, str(time.year), '%s Event %d' % (time.strftime('%Y-%m-%d'), event))
+			os.makedirs(directory, exist_ok = True)
+			index = 0
+			count = 0
+			while count < self._per_directory and written + count < self._files:
+				index += 1
+				time = time + datetime.timedelta(seconds = self._random.randint(5, 600))
+				count += self.write_shot(directory, index, time)
+			written += count
+		with open(os.path.join(self._directory, 'library.json'), 'w') as f:
+			json.dump({'parameters': self.get_parameters(), 'counts': self._counts}, f, indent = 1)
+		return self._counts
+
+def syntax():
+	print('Syntax: %s [--files=<n>] [--per-directory=<n>] [--seed=<n>] [--raw-share=<p>] [--orphan-share=<p>] [--set-share=<p>] [--video-share=<p>] [--rotated-share=<p>] [--size=<w>x<h>] <directory>' % sys.argv[0])
+	sys.exit(1)
+
+def main():
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], '', ['files=', 'per-directory=', 'seed=', 'raw-share=', 'orphan-share=', 'set-share=', 'video-share=', 'rotated-share=', 'size='])
+		if len(args) != 1: syntax()
+		options = {}
+		for opt, arg in opts:
+			key = opt[2:].replace('-', '_')
+			if key in ['files', 'per_directory', 'seed']: options[key] = int(arg)
+			elif key == 'size': options[key] = tuple(int(value) for value in arg.split('x', 1))
+			else: options[key] = float(arg)
+	except (getopt.GetoptError, ValueError):
+		syntax()
+	counts = Library(args[0], **options).generate()
+	print('Generated %d files in %s: %s' % (sum(counts.values()), args[0], ', '.join('%d %s' % (counts[kind], kind) for kind in sorted(counts))))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Compare the latency of the sequential and the pipelined Batch.prepare (POSTPROCESS of a directory)
+#
+# Usage: pipeline.py [--sizes=1000,10000] [--read-jobs=<n>,...] [--library-dir=<directory>] [--repeat=<n>]
+# Every prepare runs in a child process to start with empty caches. Libraries are shared with run.py.
+import getopt
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import run
+
+# Prepare postprocessing of directory; read_jobs = 0 runs the sequential prepare
+def run_prepare(directory, read_jobs):
+	import gi
+	gi.require_version('Gtk', '4.0')
+	from rename_images import Annotations, Batch, Config, ConsoleProgress, Mode
+	properties = dict(Mode.POSTPROCESS, pipeline = read_jobs > 0, limits = {'read': max(read_jobs, 1)})
+	batch = Batch.Batch([directory])
+	batch.init(properties, ConsoleProgress.ConsoleProgress(None))
+	start = time.perf_counter()
+	Annotations.run_until_complete(batch.prepare())
+	seconds = time.perf_counter() - start
+	actions = dict([(check.__name__, sum([len(files) for files in roots.values()])) for check, roots in batch._file_actions.items()])
+	with open(os.path.join(Config.get_data_dir('reports'), '%s.json' % batch._run_id)) as f:
+		phases = json.load(f)['phases']
+	return {'read_jobs': read_jobs, 'prepare': seconds, 'actions': actions, 'phases': phases}
+
+def syntax():
+	print('Syntax: %s [--sizes=<n>,...] [--read-jobs=<n>,...] [--library-dir=<directory>] [--repeat=<n>]' % sys.argv[0])
+	sys.exit(1)
+
+def main():
+	if len(sys.argv) == 4 and sys.argv[1] == '--child':
+		print(json.dumps(run_prepare(sys.argv[2], int(sys.argv[3]))))
+		return
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], '', ['sizes=', 'read-jobs=', 'library-dir=', 'repeat='])
+		options = dict(opts)
+		sizes = [int(size) for size in options.get('--sizes', '1000,10000').split(',')]
+		read_jobs = [int(jobs) for jobs in options.get('--read-jobs', '1,4,8').split(',')]
+		repeat = int(options.get('--repeat', 3))
+	except (getopt.GetoptError, ValueError):
+		syntax()
+	if args: syntax()
+	base = options.get('--library-dir', os.path.join(tempfile.gettempdir(), 'rename_images-benchmark'))
+	for size in sizes:
+		directory = run.get_library(base, size)
+		print('%d files:' % size)
+		sequential = None
+		for jobs in [0] + read_jobs:
+			results = []
+			for index in range(repeat):
+				output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', directory, str(jobs)])
+				results.append(json.loads(output.decode('utf-8').splitlines()[-1]))
+			# Median of the runs
+			result = sorted(results, key = lambda result: result['prepare'])[len(results) // 2]
+			if sequential is None: sequential = result
+			elif result['actions'] != sequential['actions']:
+				print('  results differ from the sequential prepare: %s != %s' % (result['actions'], sequential['actions']))
+			print('  %-22s %8.3fs %6.2fx' % ('sequential' if jobs == 0 else 'pipelined, %d readers' % jobs, result['prepare'], sequential['prepare'] / result['prepare'] if result['prepare'] > 0 else 0))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Measure how the sharded Batch.prepare (POSTPROCESS of a directory) scales with the number of worker processes
+#
+# Usage: processes.py [--sizes=10000,100000] [--processes=<n>,...] [--library-dir=<directory>]
+# Every prepare runs in a child process to start with empty caches. Libraries are shared with run.py.
+import getopt
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import run
+
+# Prepare postprocessing of directory in processes worker processes (0: in this process)
+def run_prepare(directory, processes):
+	import gi
+	gi.require_version('Gtk', '4.0')
+	from rename_images import Annotations, Batch, ConsoleProgress, Mode
+	batch = Batch.Batch([directory])
+	batch.init(dict(Mode.POSTPROCESS, processes = processes), ConsoleProgress.ConsoleProgress(None))
+	start = time.perf_counter()
+	Annotations.run_until_complete(batch.prepare())
+	seconds = time.perf_counter() - start
+	actions = dict([(check.__name__, sum([len(files) for files in roots.values()])) for check, roots in batch._file_actions.items()])
+	return {'processes': processes, 'prepare': seconds, 'files': batch._file_count, 'actions': actions}
+
+def syntax():
+	print('Syntax: %s [--sizes=<n>,...] [--processes=<n>,...] [--library-dir=<directory>]' % sys.argv[0])
+	sys.exit(1)
+
+def main():
+	if len(sys.argv) == 4 and sys.argv[1] == '--child':
+		print(json.dumps(run_prepare(sys.argv[2], int(sys.argv[3]))))
+		return
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], '', ['sizes=', 'processes=', 'library-dir='])
+		options = dict(opts)
+		sizes = [int(size) for size in options.get('--sizes', '10000,100000').split(',')]
+		processes = [int(count) for count in options.get('--processes', '2,4,%d' % (os.cpu_count() or 1)).split(',')]
+	except (getopt.GetoptError, ValueError):
+		syntax()
+	if args: syntax()
+	base = options.get('--library-dir', os.path.join(tempfile.gettempdir(), 'rename_images-benchmark'))
+	for size in sizes:
+		directory = run.get_library(base, size)
+		print('%d files:' % size)
+		single = None
+		for count in [0] + sorted(set(processes)):
+			output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', directory, str(count)])
+			result = json.loads(output.decode('utf-8').splitlines()[-1])
+			if single is None: single = result
+			elif (result['files'], result['actions']) != (single['files'], single['actions']):
+				print('  results differ from the single process prepare: %s != %s' % (result['actions'], single['actions']))
+			print('  %-14s %8.3fs %8.0f files/s %6.2fx' % ('1 process' if count == 0 else '%d processes' % count, result['prepare'], result['files'] / result['prepare'] if result['prepare'] > 0 else 0, single['prepare'] / result['prepare'] if result['prepare'] > 0 else 0))
+
+if __name__ == '__main__':
+	main()
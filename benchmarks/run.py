@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Benchmark Batch.prepare in every mode, the rename planner and the preview on synthetic libraries
+#
+# Usage: run.py [--sizes=1000,10000,100000] [--library-dir=<directory>] [--output=<file>]
+#        run.py --compare <old results> <new results>
+# Libraries are generated once per size (see generate_library.py) and reused while their parameters match.
+# Results are stored as JSON (default: $XDG_CACHE_HOME/rename_images/benchmarks/<version>-<date>.json).
+import datetime
+import getopt
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_library
+
+# Default library sizes (number of files)
+SIZES = [1000, 10000, 100000]
+# Modes to benchmark (names in rename_images.Mode)
+MODES = ['PANORAMA', 'HDR', 'GROUP', 'DATE', 'POSTPROCESS']
+
+# Get library of size files below base, generating it if it does not exist yet
+def get_library(base, size):
+	directory = os.path.join(base, str(size))
+	library = generate_library.Library(directory, files = size)
+	try:
+		with open(os.path.join(directory, 'library.json')) as f:
+			if json.load(f)['parameters'] == json.loads(json.dumps(library.get_parameters())): return directory
+	except (OSError, ValueError, KeyError):
+		pass
+	print('Generating library with %d files in %s ...' % (size, directory))
+	shutil.rmtree(directory, ignore_errors = True)
+	library.generate()
+	return directory
+
+# Get all media files of library
+def get_files(directory):
+	files = []
+	for root, directories, names in os.walk(directory):
+		directories.sort()
+		files += [os.path.join(root, name) for name in sorted(names) if name != 'library.json']
+	return files
+
+# Get version of the code being benchmarked
+def get_version():
+	try:
+		return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd = os.path.dirname(os.path.abspath(__file__)), stderr = subprocess.DEVNULL).decode('utf-8').strip()
+	except (OSError, subprocess.CalledProcessError):
+		return 'unknown'
+
+# Run benchmarks on one library; runs in a child process to start with empty caches and to measure its peak memory
+def run_library(directory):
+	import gi
+	gi.require_version('Gtk', '4.0')
+	from rename_images import Annotations, Batch, Config, ConsoleProgress, File, Mode
+	files = get_files(directory)
+	results = {'files': len(files), 'modes': {}}
+	for name in MODES:
+		File.METADATA_CACHE.clear()
+		File.DIRECTORY_CACHE.clear()
+		properties = getattr(Mode, name)
+		# Rename modes get the selected files, postprocessing the directory (as from Nautilus)
+		uris = [directory] if properties['command'] == 'postprocess' else files
+		batch = Batch.Batch(uris)
+		batch.init(dict(properties), ConsoleProgress.ConsoleProgress(None))
+		start = time.perf_counter()
+		Annotations.run_until_complete(batch.prepare())
+		result = {'prepare': time.perf_counter() - start}
+		with open(os.path.join(Config.get_data_dir('reports'), '%s.json' % batch._run_id)) as f:
+			result['phases'] = json.load(f)['phases']
+		if name == 'DATE':
+			batch_files = [file for group in batch._files_by_group.values() for file in group._files]
+			start = time.perf_counter()
+			try:
+				for item in batch.assign_base_numbers(): pass
+				for item in batch.calculate_rename_order(): pass
+			except Exception as e:
+				result['planner_error'] = str(e)
+			result['planner'] = time.perf_counter() - start
+			start = time.perf_counter()
+			for file in batch_files: batch.get_preview(file)
+			result['preview'] = time.perf_counter() - start
+		results['modes'][name] = result
+		print('  %-11s prepare %8.3fs%s' % (name, result['prepare'], ', planner %.3fs, preview %.3fs' % (result['planner'], result['preview']) if 'planner' in result else ''), file = sys.stderr)
+	results['max_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return results
+
+# Flatten results into metric name -> seconds
+def get_metrics(results):
+	metrics = {}
+	for size, result in results['results'].items():
+		for mode, timings in result['modes'].items():
+			for key in ['prepare', 'planner', 'preview']:
+				if key in timings: metrics['%s %s %s' % (size, mode, key)] = timings[key]
+	return metrics
+
+# Print comparison of two result files
+def compare(old_path, new_path):
+	with open(old_path) as f: old = json.load(f)
+	with open(new_path) as f: new = json.load(f)
+	old_metrics = get_metrics(old)
+	new_metrics = get_metrics(new)
+	print('%-32s %12s %12s %8s' % ('', old['version'], new['version'], 'ratio'))
+	for key in sorted(set(old_metrics) & set(new_metrics), key = lambda key: (int(key.split()[0]), key)):
+		ratio = new_metrics[key] / old_metrics[key] if old_metrics[key] > 0 else float('inf')
+		print('%-32s %11.3fs %11.3fs %7.2fx' % (key, old_metrics[key], new_metrics[key], ratio))
+
+def syntax():
+	print('Syntax: %s [--sizes=<n>,...] [--library-dir=<directory>] [--output=<file>]' % sys.argv[0])
+	print('        %s --compare <old results> <new results>' % sys.argv[0])
+	sys.exit(1)
+
+def main():
+	if len(sys.argv) == 3 and sys.argv[1] == '--child':
+		print(json.dumps(run_library(sys.argv[2])))
+		return
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], '', ['sizes=', 'library-dir=', 'output=', 'compare'])
+	except getopt.GetoptError:
+		syntax()
+	options = dict(opts)
+	if '--compare' in options:
+		if len(args) != 2: syntax()
+		compare(*args)
+		return
+	if args: syntax()
+	try:
+		sizes = [int(size) for size in options['--sizes'].split(',')] if '--sizes' in options else SIZES
+	except ValueError:
+		syntax()
+	base = options.get('--library-dir', os.path.join(tempfile.gettempdir(), 'rename_images-benchmark'))
+	version = get_version()
+	results = {'version': version, 'date': datetime.datetime.now().isoformat(), 'python': platform.python_version(), 'results': {}}
+	for size in sizes:
+		directory = get_library(base, size)
+		print('Benchmarking %d files ...' % size, file = sys.stderr)
+		output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', directory])
+		results['results'][str(size)] = json.loads(output.decode('utf-8').splitlines()[-1])
+	if '--output' in options:
+		path = options['--output']
+	else:
+		from rename_images import Config
+		path = os.path.join(Config.get_data_dir('benchmarks'), '%s-%s.json' % (version, datetime.datetime.now().strftime('%Y%m%d-%H%M%S')))
+	with open(path, 'w') as f:
+		json.dump(results, f, indent = 1)
+	print('Wrote results to %s' % path)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Stand-in for the external tools called by file actions (jhead, convert-raw, postprocess-photo, recodevideos)
+# The tool is selected by the name it is called with (see the symlinks next to this file).
+#
+# Behaviour is configured by environment variables:
+#   STUB_LATENCY           seconds per call (default 0.05)
+#   STUB_LATENCY_PER_FILE  additional seconds per input file (default 0.01)
+#   STUB_JITTER            relative random variation of the latency (default 0.2)
+#   STUB_OUTPUT_LINES      progress lines written per call (default 20)
+#   STUB_FAILURE_RATE      probability that a call (or for jhead: a file) fails (default 0)
+#   STUB_SEED              random seed (default: random)
+#
+# Use with: RENAME_IMAGES_TOOL_DIR=<this directory>
+import os
+import random
+import shutil
+import struct
+import sys
+import time
+
+# Read a number from the environment
+def get_float(name, default):
+	try:
+		return float(os.environ.get(name, default))
+	except ValueError:
+		return default
+
+LATENCY = get_float('STUB_LATENCY', 0.05)
+LATENCY_PER_FILE = get_float('STUB_LATENCY_PER_FILE', 0.01)
+JITTER = get_float('STUB_JITTER', 0.2)
+OUTPUT_LINES = int(get_float('STUB_OUTPUT_LINES', 20))
+FAILURE_RATE = get_float('STUB_FAILURE_RATE', 0)
+RANDOM = random.Random(os.environ.get('STUB_SEED'))
+
+# Spend the configured time for files while writing progress output
+def work(name, files):
+	duration = (LATENCY + LATENCY_PER_FILE * len(files)) * (1 + JITTER * (2 * RANDOM.random() - 1))
+	lines = max(OUTPUT_LINES, 1)
+	for line in range(lines):
+		time.sleep(max(duration, 0) / lines)
+		if OUTPUT_LINES > 0: print('%s: step %d/%d' % (name, line + 1, lines), flush = True)
+
+# Set EXIF orientation of a JPEG to 1 in place (like jhead -autorot after rotating the pixels); returns False if there is none
+def reset_orientation(path):
+	with open(path, 'r+b') as f:
+		data = f.read(65536)
+		start = data.find(b'Exif\0\0')
+		if start < 0: return False
+		tiff = start + 6
+		endian = '<' if data[tiff:tiff + 2] == b'II' else '>'
+		ifd = tiff + struct.unpack(endian + 'I', data[tiff + 4:tiff + 8])[0]
+		count = struct.unpack(endian + 'H', data[ifd:ifd + 2])[0]
+		for index in range(count):
+			entry = ifd + 2 + 12 * index
+			tag = struct.unpack(endian + 'H', data[entry:entry + 2])[0]
+			if tag != 0x0112: continue
+			if struct.unpack(endian + 'H', data[entry + 8:entry + 10])[0] == 1: return True
+			f.seek(entry + 8)
+			f.write(struct.pack(endian + 'H', 1))
+			return True
+	return False
+
+# jhead -autorot <files>: per-file errors are reported like jhead does
+def jhead(args):
+	files = [arg for arg in args if not arg.startswith('-')]
+	work('jhead', files)
+	for path in files:
+		if RANDOM.random() < FAILURE_RATE:
+			print("Nonfatal Error : '%s' Stub failure" % path, flush = True)
+			continue
+		try:
+			if reset_orientation(path): print('Modified: %s' % path, flush = True)
+		except (OSError, struct.error) as e:
+			print("Error : '%s' %s" % (path, e), flush = True)
+	return 0
+
+# postprocess-photo -p|-h -o <output> <files>: the first input stands in for the stitched result
+def postprocess_photo(args):
+	output = args[args.index('-o') + 1]
+	files = args[args.index('-o') + 2:]
+	work('postprocess-photo', files)
+	if RANDOM.random() < FAILURE_RATE:
+		print('postprocess-photo: stub failure', flush = True)
+		return 1
+	if files and not os.path.exists(output): shutil.copyfile(files[0], output)
+	return 0
+
+# convert-raw <file>, recodevideos <file>: only take time
+def convert(name, args):
+	work(name, args)
+	if RANDOM.random() < FAILURE_RATE:
+		print('%s: stub failure' % name, flush = True)
+		return 1
+	return 0
+
+def main():
+	name = os.path.basename(sys.argv[0])
+	args = sys.argv[1:]
+	if name == 'jhead': return jhead(args)
+	if name == 'postprocess-photo': return postprocess_photo(args)
+	if name in ['convert-raw', 'recodevideos']: return convert(name, args)
+	print('Unknown tool %s' % name, file = sys.stderr)
+	return 2
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Measure the overhead of Annotations.trace on the rename planner and the preview
+#
+# Usage: trace_overhead.py [<number of files>]
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tracing modes to compare
+MODES = ['', 'warn']
+
+# Plan renaming of count empty files and compute their preview; runs with tracing mode from environment
+def run_planner(count):
+	import gi
+	gi.require_version('Gtk', '4.0')
+	from rename_images import Batch, ConsoleProgress, File, FileCheck, Mode
+	directory = tempfile.mkdtemp()
+	try:
+		batch = Batch.Batch([directory])
+		batch.init(Mode.DATE, ConsoleProgress.ConsoleProgress(None))
+		# Add files without reading tags; the creation time falls back to the file date
+		for index in range(count):
+			path = os.path.join(directory, 'IMG_%05d.jpg' % index)
+			open(path, 'w').close()
+			file = File.File(batch, 'file://' + path)
+			file.set_default_properties(False)
+			batch.add_file(file)
+		batch._common_path = File.File(batch, 'file://' + directory)
+		batch._file_actions = dict([(check, {}) for check in FileCheck.Check.get_file_checks()])
+		batch._base = 'Benchmark'
+		files = [file for group in batch._files_by_group.values() for file in group._files]
+		start = time.perf_counter()
+		for item in batch.assign_base_numbers(): pass
+		for item in batch.calculate_rename_order(): pass
+		planner = time.perf_counter() - start
+		start = time.perf_counter()
+		for file in files: batch.get_preview(file)
+		preview = time.perf_counter() - start
+		return {'planner': planner, 'preview': preview}
+	finally:
+		shutil.rmtree(directory)
+
+# Measure the cost of one call through the tracing wrapper (independent of the configured mode)
+def measure_call_overhead():
+	from rename_images import Annotations
+	def function(value):
+		return value
+	number = 200000
+	plain = timeit.timeit(lambda: function(1), number=number)
+	wrapped = Annotations.traced(function)
+	traced = timeit.timeit(lambda: wrapped(1), number=number)
+	return (traced - plain) / number
+
+def main():
+	if len(sys.argv) > 2 and sys.argv[1] == '--child':
+		print(json.dumps(run_planner(int(sys.argv[2]))))
+		return
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+	print('Tracing wrapper costs %.2fus per call' % (measure_call_overhead() * 1e6))
+	results = {}
+	for mode in MODES:
+		env = dict(os.environ, RENAME_IMAGES_TRACE=mode)
+		output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', str(count)], env=env)
+		results[mode] = json.loads(output.decode('utf-8').splitlines()[-1])
+		print('RENAME_IMAGES_TRACE=%-5s planner %.3fs, preview %.3fs for %d files' % (repr(mode), results[mode]['planner'], results[mode]['preview'], count))
+	for phase in ['planner', 'preview']:
+		saved = results['warn'][phase] - results[''][phase]
+		print('Disabled tracing saves %.2fus per file in the %s' % (saved / count * 1e6, phase))
+
+if __name__ == '__main__':
+	main()
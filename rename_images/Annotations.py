@@ -1,14 +1,30 @@
-import datetime
 import inspect
+import json
 import logging
+import os
 import sys
+import threading
+import time
 import traceback
 import types
 
 from gi.repository import GLib
 
 logger = logging.getLogger('Annotations')
-LOGTRACE = False
+# Tracing mode, selected at import time: '' (off, functions are not wrapped at all), 'warn' (warn about slow calls), 'log' (log all calls),
+# 'events' (record all calls as spans for write_trace_events)
+TRACE = os.environ.get('RENAME_IMAGES_TRACE', '')
+LOGTRACE = TRACE == 'log'
+TRACE_EVENTS = TRACE == 'events'
+# Calls taking longer than this (seconds) are reported
+SLOW_CALL = 0.2
+# Maximum number of recorded spans
+MAX_TRACE_EVENTS = 2000000
+
+# Recorded spans (name, start, duration, thread id, nesting depth) and nesting depth per thread
+_trace_events = []
+_trace_local = threading.local()
+_trace_origin = time.perf_counter()
 
 def get_function_name(func, func_name = None):
 	if inspect.ismethod(func):
@@ -22,16 +38,25 @@ def get_generator_line_str(generator):
 	else:
 		return "%s:%d" % (generator.gi_frame.f_code.co_filename.split('/')[-1], generator.gi_frame.f_lineno)
 
-# Print trace output
+# Print trace output; the wrapper is only installed if tracing is enabled at import time
 def trace(func, func_name = None):
+	if not TRACE: return func
+	return traced(func, func_name)
+
+# Wrap function to trace its calls
+def traced(func, func_name = None):
 	fn = get_function_name(func, func_name)
+	is_next = func.__name__ == '__next__' and type(func).__name__ == 'method-wrapper'
 	def run(*args, **kwds):
 		# Determine additional parameters for generators
-		if func.__name__ == 'next' and type(func).__name__ == 'method-wrapper':
+		if is_next:
 			line_from = " [%s]" % get_generator_line_str(func.__self__)
 		else:
 			line_from = ""
-		start = datetime.datetime.now()
+		if TRACE_EVENTS:
+			depth = getattr(_trace_local, 'depth', 0)
+			_trace_local.depth = depth + 1
+		start = time.perf_counter()
 		# Trace start of function
 		if LOGTRACE and logger.isEnabledFor(logging.DEBUG):
 			level = len(traceback.format_stack())
@@ -51,8 +76,8 @@ def trace(func, func_name = None):
 			raise
 		finally:
 			# Determine additional parameters for generators
-			end = datetime.datetime.now()
-			if func.__name__ == 'next' and type(func).__name__ == 'method-wrapper':
+			duration = time.perf_counter() - start
+			if is_next:
 				line_to = ' -> [%s]' % get_generator_line_str(func.__self__)
 			else:
 				line_to = ""
@@ -63,49 +88,205 @@ def trace(func, func_name = None):
 				else:
 					logger.debug('%s %s: %s %s%s', '<' * level, fn, str(exc_type), str(exc_value), line_to)
 			# Warn about long execution times
-			if end - start > datetime.timedelta(milliseconds=200):
-				logger.warn('%s%s%s took %.3fs', fn, line_from, line_to, (end - start).total_seconds())
+			if duration > SLOW_CALL:
+				logger.warn('%s%s%s took %.3fs', fn, line_from, line_to, duration)
+			# Record span
+			if TRACE_EVENTS:
+				_trace_local.depth = depth
+				if len(_trace_events) < MAX_TRACE_EVENTS:
+					_trace_events.append((fn, start, duration, threading.get_ident(), depth))
 	return run
 
+# Drop recorded spans
+def clear_trace_events():
+	del _trace_events[:]
+
+# Write recorded spans as Chrome trace-event JSON (viewable in chrome://tracing or Perfetto)
+def write_trace_events(path):
+	if not TRACE_EVENTS: return
+	pid = os.getpid()
+	events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'rename_images'}}]
+	for thread in threading.enumerate():
+		events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread.ident, 'args': {'name': thread.name}})
+	for name, start, duration, tid, depth in list(_trace_events):
+		events.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': tid, 'ts': (start - _trace_origin) * 1e6, 'dur': duration * 1e6, 'args': {'depth': depth}})
+	with open(path, 'w') as f:
+		json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+	if len(_trace_events) >= MAX_TRACE_EVENTS:
+		logger.warn('Trace is incomplete, only the first %d spans were recorded', MAX_TRACE_EVENTS)
+	logger.info('Wrote %d trace events to %s', len(_trace_events), path)
+
 class TracingGenerator:
 	def __init__(self, gen, fn):
 		self._generator = gen
 		self._fn = fn
+		self._next = traced(gen.__next__, "%s.next" % fn)
+		self._send = traced(gen.send, "%s.send" % fn)
 
 	def __iter__(self):
 		return self
 
 	def __next__(self):
-		return trace(self._generator.__next__, "%s.next" % self._fn)()
+		return self._next()
 
 	def send(self, value):
-		return self._generator.send(value)
+		return self._send(value)
 
 	def throw(self):
 		return self._generator.throw()
 
-# Execute a function pausing at yields
-def yieldsleep(func):
-	# Define function start which wraps func and initializes the execution
+	def close(self):
+		return self._generator.close()
+
+# Event a generator can yield to sleep until the event is set (instead of yielding a timeout in milliseconds)
+class Event:
+	def __init__(self):
+		self._set = False
+		self._callbacks = []
+
+	# Check whether event was set
+	def is_set(self):
+		return self._set
+
+	# Set event and call connected callbacks
+	def set(self):
+		if self._set: return
+		self._set = True
+		callbacks, self._callbacks = self._callbacks, []
+		for callback in callbacks: callback()
+
+	# Call callback once when event is set
+	def connect(self, callback):
+		if self._set: callback()
+		else: self._callbacks.append(callback)
+
+	# Remove callback
+	def disconnect(self, callback):
+		if callback in self._callbacks: self._callbacks.remove(callback)
+
+	# Create event which is set as soon as one of the events is set
+	@staticmethod
+	def any(*events):
+		combined = Event()
+		if any([event.is_set() for event in events]):
+			combined.set()
+			return combined
+		def on_set():
+			for event in events: event.disconnect(on_set)
+			combined.set()
+		for event in events: event.connect(on_set)
+		return combined
+
+	# Create event which is set after time milliseconds
+	@staticmethod
+	def timeout(time):
+		event = Event()
+		def on_timeout():
+			event.set()
+			return False
+		GLib.timeout_add(time, on_timeout)
+		return event
+
+# Priorities of tasks; tasks with higher priority run first and get longer time slices
+PRIORITY_LOW = 1
+PRIORITY_DEFAULT = 2
+PRIORITY_HIGH = 4
+# Duration of a frame and bounds of the time slice for running tasks per main loop iteration (seconds)
+FRAME_TIME = 1.0 / 60
+MIN_SLICE = 0.002
+MAX_SLICE = FRAME_TIME * 0.75
+
+# Generator executed by the dispatcher
+class Task:
+	def __init__(self, generator, priority, name):
+		self.generator = generator
+		self.priority = priority
+		self.name = name
+		self.done = Event()
+		self.exc_info = None
+
+	# Display nicely on print
+	def __str__(self):
+		return self.name
+
+# Cooperative scheduler running tasks from an idle source of the main loop
+# Tasks yield None to continue, an Event to sleep until it is set or a time in milliseconds to sleep
+class Dispatcher:
+	def __init__(self):
+		self._ready = []
+		self._source = None
+		self._slice = MAX_SLICE
+		self._last_end = None
+
+	# Add generator as new task
+	def spawn(self, generator, priority = PRIORITY_DEFAULT, name = None):
+		task = Task(generator, priority, name or str(generator))
+		self.wake(task)
+		return task
+
+	# Mark task as ready to run
+	def wake(self, task):
+		self._ready.append(task)
+		if self._source is None:
+			self._source = GLib.idle_add(self.dispatch, priority=GLib.PRIORITY_DEFAULT_IDLE)
+
+	# Adapt the time slice to the time the main loop needed for other sources (e.g. drawing) since the last dispatch
+	def adapt_slice(self, now):
+		if self._last_end is None: return
+		remaining = FRAME_TIME - (now - self._last_end)
+		self._slice = max(MIN_SLICE, min(MAX_SLICE, (self._slice + remaining) / 2))
+
+	# Run ready tasks by priority, each for its share of the time slice
+	def dispatch(self):
+		now = time.perf_counter()
+		self.adapt_slice(now)
+		tasks, self._ready = sorted(self._ready, key=lambda task: -task.priority), []
+		total = sum([task.priority for task in tasks])
+		for task in tasks:
+			self.run_task(task, time.perf_counter() + self._slice * task.priority / total)
+		self._last_end = time.perf_counter()
+		if len(self._ready) > 0: return True
+		# Nothing to do until an event occurs
+		self._source = None
+		self._last_end = None
+		return False
+
+	# Run task up to its deadline or until it sleeps
+	def run_task(self, task, deadline):
+		try:
+			while True:
+				wait = next(task.generator)
+				if wait is None:
+					if time.perf_counter() < deadline: continue
+					self._ready.append(task)
+				else:
+					if not isinstance(wait, Event): wait = Event.timeout(wait)
+					wait.connect(lambda: self.wake(task))
+				return
+		except StopIteration:
+			pass
+		except Exception:
+			task.exc_info = sys.exc_info()
+			logger.error('Task %s failed', task)
+			traceback.print_exception(*task.exc_info)
+		task.done.set()
+
+DISPATCHER = Dispatcher()
+
+# Execute a function pausing at yields (see Dispatcher); may be used as @yieldsleep or @yieldsleep(priority=...)
+def yieldsleep(func = None, priority = PRIORITY_DEFAULT):
+	if func is None:
+		return lambda func: yieldsleep(func, priority)
+	# Define function start which wraps func and schedules the execution
 	def start(*args, **kwds):
-		# Create generator
-		generator = func(*args, **kwds)
-		#  Define function step which executes func up to (one of the) next yields and schedules the next step
-		def step(*args, **kwds):
-			try:
-				# Run func up to next yield
-				start = end = datetime.datetime.now()
-				while end - start < datetime.timedelta(milliseconds=50):
-					time = next(generator)
-					end = datetime.datetime.now()
-				# Schedule next step of func
-				if time is None: GLib.idle_add(step)
-				else: GLib.timeout_add(time, step)
-			except StopIteration:
-				pass
-		step.__name__ = "%s::step" % func.__name__
-		# Schedule first step of func
-		GLib.idle_add(step)
+		return DISPATCHER.spawn(func(*args, **kwds), priority, func.__name__)
 	start.__name__ = "%s::start" % func.__name__
 	return start
 
+# Run generator on a new main loop until it finished (for use without GUI); raises exceptions of the generator
+def run_until_complete(generator, priority = PRIORITY_DEFAULT):
+	loop = GLib.MainLoop()
+	task = DISPATCHER.spawn(generator, priority, 'run_until_complete')
+	task.done.connect(loop.quit)
+	if not task.done.is_set(): loop.run()
+	if task.exc_info is not None: raise task.exc_info[1]
@@ -1,12 +1,15 @@
+import collections
+import concurrent.futures
 import datetime
+import itertools
 import logging
 import os
 import re
 import sys
 import traceback
 
-from gi.repository import GObject, Gtk, Gio
-from .Annotations import trace
+from gi.repository import GObject, Gtk, Gio, GLib
+from .Annotations import TRACE_EVENTS, Event, clear_trace_events, trace, write_trace_events
 
 logger = logging.getLogger('Batch')
 
@@ -19,9 +22,29 @@ class Batch(GObject.GObject):
 		GObject.GObject.__init__(self)
 		self._initial_files = []
 		self._common_path = None
+		self._properties = None
+		self._snapshot = {}
+		self._profiler = None
 		self.reset()
 		self._uris = uris
 
+	# Write spans recorded so far (if RENAME_IMAGES_TRACE=events)
+	def write_trace(self):
+		if not TRACE_EVENTS or not self._reporting: return
+		write_trace_events(os.path.join(Config.get_data_dir('traces'), '%s.json' % self._run_id))
+
+	# Write per-phase performance report of the run so far
+	def write_report(self):
+		if not self._reporting: return
+		self._report.set_count('files', self._file_count)
+		self._report.set_count('groups', len(self._files_by_group))
+		self._report.write()
+
+	# Stop profiling and memory tracing (the batch is not executed, e.g. the user cancelled)
+	def close_profiler(self):
+		if self._profiler is not None: self._profiler.close()
+		self._profiler = None
+
 	# Convert paths to uris
 	def prepare_uri(self, uri):
 		if uri.startswith('/'):
@@ -43,6 +66,13 @@ class Batch(GObject.GObject):
 		self._files_by_group = {}
 		self._files_by_root = {}
 		self._file_actions = {}
+		self._files_by_uri = {}
+		self._changed = []
+		self._dirty_roots = None
+		self._dirty_groups = None
+		self._pipeline = None
+		self._check_roots = None
+		self._check_groups = None
 		for file in self._initial_files: file.reset()
 
 	# Test whether files with type IMAGE or VIDEO were added (lazy: check for directories always is True)
@@ -63,17 +93,42 @@ class Batch(GObject.GObject):
 	# Set properties for command to be executed
 	@trace
 	def init(self, properties, progresswindow):
+		# A prepare with the same properties keeps the state of unchanged files (see add_file)
+		if properties != self._properties: self._snapshot = {}
+		self._properties = dict(properties)
+		self._previous_actions = self._file_actions if self._snapshot else {}
 		self.reset()
+		self._run_id = '%s-%d-%d' % (datetime.datetime.now().strftime('%Y%m%d-%H%M%S'), os.getpid(), next(RUN_COUNTER))
+		clear_trace_events()
+		# A profiler of a previous prepare (e.g. before Reload) must not keep tracing
+		self.close_profiler()
+		self._profiler = Profiler.Profiler(self._run_id) if properties.get('profile', Config.PROFILE) else None
+		self._report = Report.Report(self._run_id, properties, self._profiler.snapshot if self._profiler else None)
+		self._reporting = properties.get('report', True)
 		self._allow_subgroups = properties.get('allow_subgroups', True)
 		self._tag = properties.get('tag', None)
 		self._counter = properties.get('counter', 0)
 		self._format = properties.get('format', '{directory:s}/{base:s}{alphacounter:s}{extension:s}')
 		self._basepattern = re.compile(properties.get('basepattern', r'^(?P<base>.*?)\s*[0-9]*$'))
-		self._grouppattern = re.compile(r'^(?P<group>.*?)(?P<index>((?<=[0-9])|\([a-z]*\)?)?\.[^.]*)$')
+		self._grouppattern = GROUP_PATTERN
 		self._recursive = properties.get('recursive', False)
+		self._pipelined = properties.get('pipeline', Config.PIPELINE)
+		self._processes = properties.get('processes', Config.PROCESSES)
+		queue = properties.get('queue', Config.QUEUE)
+		self._queue = JobQueue.JobQueue(queue) if queue else None
 		self._command = properties.get('command', 'postprocess')
+		self._orientation = properties.get('orientation', 'pixels')
+		self._limits = Scheduler.get_default_limits()
+		self._limits.update(properties.get('limits', {}))
+		memory_budget = properties.get('memory_budget', None)
+		self._memory_budget = memory_budget * 1024 * 1024 if memory_budget else Scheduler.get_default_memory_budget()
 		self._progresswindow = progresswindow
 
+	# Get command running an external tool for heavy actions; runs on queue workers if the batch has a queue (see JobQueue)
+	def get_command(self, label):
+		if self._queue is not None: return JobQueue.RemoteCommand(self._queue, self._progresswindow, label)
+		return Command.Command(self._progresswindow, label)
+
 	# Calculate common root of file with the rest of the batch
 	def get_common_root(self, file):
 		common_root = file.get_common_root(self._common_path)
@@ -97,39 +152,237 @@ class Batch(GObject.GObject):
 	# Prepare rename or postrocessing (autorotation, panorama/HDR creation) command of files in batch
 	@trace
 	def prepare(self):
-		self._progresswindow.set_title('Image batch loading')
-		self._progresswindow.set_visible(True)
+		if self._profiler is not None: self._profiler.start()
+		try:
+			self._progresswindow.set_title('Image batch loading')
+			self._progresswindow.set_visible(True)
+			# Incremental prepares need the complete scan to find removed files
+			if self._processes > 1 and self._recursive and not self._snapshot and self.has_shard_python():
+				for item in self._report.measure('sharded', self.prepare_sharded()): yield item
+			elif self._pipelined and not self._snapshot:
+				for item in self._report.measure('pipeline', self.prepare_pipelined()): yield item
+			else:
+				for item in self.add_uris(): yield item
+				self.update_dirty()
+				for item in self.check_files(): yield item
+			self._base = self.get_default_base()
+			self._snapshot = self._files_by_uri
+			self._progresswindow.set_visible(False)
+		finally:
+			self.write_report()
+			if self._profiler is not None: self._profiler.stop()
+			self.write_trace()
+
+	# Read tags and run all checks for the files of the batch
+	def check_files(self):
+		for item in self._report.measure('init_files', self.init_files()): yield item
+		for check in FileCheck.Check.get_file_checks():
+			# Keep results of the previous prepare for roots without changes
+			self._file_actions[check] = dict([(root, files) for root, files in self._previous_actions.get(check, {}).items() if not self.is_dirty_root(root)])
+			for file in self._report.measure('do_check:%s' % check.__name__, check.do_check(self)):
+				if file is not None: self.add_file_action(check, file)
+				yield
+
+	# Prepare with the subdirectories of the selected directories as shards on worker processes (see Shard)
+	# Shards are split into their subdirectories while there are too few to keep the processes busy
+	# Files outside of the shards (e.g. directly in the selected directories) are prepared here while the shards run
+	@trace
+	def prepare_sharded(self):
+		shards = []
+		files = []
 		self._progresswindow.set_step('Searching selected directories ...', len(self._uris))
 		for uri in self._uris:
 			uri = self.prepare_uri(uri)
 			if not self.valid_uri(uri): continue
 			file = File.File(self, uri)
 			self._common_path = self.get_common_root(file)
-			for item in self.add_files_recursively(file, self._command == 'postprocess'): yield item
-		for item in self.init_files(): yield item
-		for check in FileCheck.Check.get_file_checks():
-			self._file_actions[check] = {}
-			for file in check.do_check(self):
-				if file is not None:
-					if file.get_root() not in self._file_actions[check]:
-						self._file_actions[check][file.get_root()] = []
-					self._file_actions[check][file.get_root()].append(file)
+			if file.get_file_type() == Gio.FileType.DIRECTORY: shards.append(file)
+			else: files.append(file)
+		while len(shards) < Shard.SHARDS_PER_PROCESS * self._processes:
+			split = []
+			for directory in shards:
+				self._progresswindow.increase_step(directory.get_path())
 				yield
-		self._base = self.get_default_base()
-		self._progresswindow.set_visible(False)
+				try:
+					children = list(directory.enumerate_children())
+				except Exception as e:
+					logger.warn('Cannot list %s: %s', directory.get_path(), e)
+					continue
+				subdirectories = [child for child in children if child.get_file_type() == Gio.FileType.DIRECTORY]
+				if len(subdirectories) == 0:
+					split.append(directory)
+					continue
+				split += subdirectories
+				files += [child for child in children if child.get_file_type() != Gio.FileType.DIRECTORY]
+			if [directory.get_uri() for directory in split] == [directory.get_uri() for directory in shards]: break
+			shards = split
+		logger.info('Preparing %d directories in %d processes', len(shards), self._processes)
+		pool = Shard.ShardPool([directory.get_uri() for directory in shards], self._properties, self._processes)
+		try:
+			for file in files:
+				for item in self._report.measure('add_files_recursively', self.add_files_recursively(file, self._command == 'postprocess')): yield item
+			for item in self.check_files(): yield item
+			self._progresswindow.set_step('Preparing %d directories in %d processes ...' % (len(shards), self._processes), len(shards))
+			while pool.has_pending():
+				event = pool.get_event()
+				# The shard may have finished before the new event was created
+				result = pool.get_ready()
+				if result is None:
+					yield event
+					continue
+				self._progresswindow.increase_step(Gio.File.new_for_uri(result[0]).get_path())
+				for item in self._report.measure('add_shard', self.add_shard(result[1])): yield item
+		finally:
+			pool.close()
+
+	# Check whether worker processes can be started for a sharded prepare
+	def has_shard_python(self):
+		if Shard.get_python() is not None: return True
+		logger.warn('No Python interpreter for %d worker processes found (set RENAME_IMAGES_PYTHON), preparing in this process', self._processes)
+		return False
+
+	# Get compact results of a prepare as shard of another batch: files with their stamps and the files found by the checks
+	# Metadata is not sent; the receiving batch reads it for files with actions only
+	def get_shard_result(self):
+		defaults = {}
+		files = [(uri, stamp, Shard.encode_properties(file, defaults)) for uri, (stamp, file) in self._files_by_uri.items()]
+		actions = []
+		for check, roots in self._file_actions.items():
+			for root, check_files in roots.items():
+				actions += [(check.__name__, file.get_uri(), Shard.encode_properties(file, defaults), file._metadata is not None) for file in check_files]
+		return {'files': files, 'actions': actions}
+
+	# Merge results of a shard prepared in another process (see get_shard_result)
+	@trace
+	def add_shard(self, result):
+		checks = dict([(check.__name__, check) for check in FileCheck.Check.get_file_checks()])
+		for uri, stamp, properties in result['files']:
+			file = File.File(self, uri)
+			file.set_default_properties(self._command == 'postprocess')
+			file.add_properties(Shard.decode_properties(self, properties))
+			self.add_file(file, stamp)
+		yield
+		for name, uri, properties, initialized in result['actions']:
+			file = self.get_file(uri)
+			file.add_properties(Shard.decode_properties(self, properties))
+			# The actions and the file action window need the tags
+			if initialized: file.init()
+			self.add_file_action(checks[name], file)
+			yield
+
+	# Get file of batch by uri (a new file with default properties if it is not part of the batch, e.g. an unselected file)
+	def get_file(self, uri):
+		if uri in self._files_by_uri: return self._files_by_uri[uri][1]
+		file = File.File(self, uri)
+		file.set_default_properties(self._command == 'postprocess')
+		return file
+
+	# Prepare as a pipeline: tags are read on worker threads while scanning, the checks run per directory as soon as
+	# it was scanned and its tags were read (see Pipeline)
+	@trace
+	def prepare_pipelined(self):
+		for check in FileCheck.Check.get_file_checks(): self._file_actions[check] = {}
+		self._pipeline = Pipeline.Pipeline(max(self._limits.get(Scheduler.READ, 1), 1))
+		try:
+			for item in self.add_uris():
+				for step in self.check_ready_directories(): yield step
+				yield item
+			self._pipeline.set_all_scanned()
+			self._progresswindow.set_step('Reading image tags and checking files ...', self._pipeline.get_pending_count())
+			while self._pipeline.has_scanned():
+				event = self._pipeline.get_event()
+				# The read may have finished before the new event was created
+				files = self._pipeline.get_ready()
+				if files is None:
+					yield event
+					continue
+				for item in self.check_directory(files): yield item
+		finally:
+			self._pipeline.close()
+			self._pipeline = None
+
+	# Run the checks for directories whose tags were read completely (pipelined prepare)
+	def check_ready_directories(self):
+		while True:
+			files = self._pipeline.get_ready()
+			if files is None: return
+			for item in self.check_directory(files): yield item
+
+	# Run all checks for the files of one directory (pipelined prepare)
+	@trace
+	def check_directory(self, files):
+		self._check_roots = collections.OrderedDict.fromkeys([file.get_root() for file in files])
+		self._check_groups = collections.OrderedDict.fromkeys([file.get_group() for file in files])
+		try:
+			for check in FileCheck.Check.get_file_checks():
+				for file in check.do_check(self):
+					if file is not None: self.add_file_action(check, file)
+					yield
+		finally:
+			self._check_roots = None
+			self._check_groups = None
+		for file in files: self._progresswindow.increase_step(file.get_path())
+
+	# Record file found by check
+	def add_file_action(self, check, file):
+		if file.get_root() not in self._file_actions[check]:
+			self._file_actions[check][file.get_root()] = []
+		self._file_actions[check][file.get_root()].append(file)
 
 	# Execute rename or postrocessing (autorotation, panorama/HDR creation) command of files in batch
 	@trace
 	def execute(self):
-		rename = self._command == 'rename'
-		if rename: title = "Image batch rename in " + self._common_path.get_path()
-		else: title = "Image batch process in " + self._common_path.get_path()
-		self._progresswindow.set_title(title)
-		self._progresswindow.set_visible(True)
-		errors = 0
-		for check in FileCheck.Check.get_file_checks():
-			# TODO: Better use (supported from python 3.3): yield from ...
-			generator = check.execute_actions(self._file_actions[check], self)
+		if self._profiler is not None: self._profiler.start()
+		try:
+			rename = self._command == 'rename'
+			if rename: title = "Image batch rename in " + self._common_path.get_path()
+			else: title = "Image batch process in " + self._common_path.get_path()
+			self._progresswindow.set_title(title)
+			self._progresswindow.set_visible(True)
+			errors = 0
+			for check in FileCheck.Check.get_file_checks():
+				# TODO: Better use (supported from python 3.3): yield from ...
+				generator = self._report.measure('execute_actions:%s' % check.__name__, check.execute_actions(self._file_actions[check], self))
+				message = None
+				while True:
+					try:
+						item = generator.send(message)
+						message = yield item
+					except StopIteration:
+						break
+					except Exception as e:
+						if e.args[0] == 'errors': errors += e.args[1]
+						else: raise
+			if errors == 0 and rename:
+				for item in self._report.measure('assign_base_numbers', self.assign_base_numbers()): yield item
+				rename_order = []
+				try:
+					for file in self._report.measure('calculate_rename_order', self.calculate_rename_order()):
+						if file is not None: rename_order.append(file)
+						yield
+				except Exception:
+					# Keep metadata changes of the actions
+					generator = self._report.measure('save_modified_files', self.save_modified_files())
+					message = None
+					while True:
+						try:
+							item = generator.send(message)
+							message = yield item
+						except StopIteration:
+							break
+						except Exception as e:
+							if e.args[0] == 'errors': errors += e.args[1]
+							else: raise
+					for group in self._files_by_group:
+						for file in self._files_by_group[group]._files:
+							if file.get_property(File.RENAMEERROR) is not None:
+								self._progresswindow.output('%s: %s\n' % (file.get_path(), file.get_property(File.RENAMEERROR)))
+								yield
+								errors += 1
+					raise Exception('Encountered %d problems. See output above.' % errors)
+				for item in self._report.measure('assign_tag', self.assign_tag()): yield item
+			# Write each file once with the metadata changes of all actions and the tag
+			generator = self._report.measure('save_modified_files', self.save_modified_files())
 			message = None
 			while True:
 				try:
@@ -140,26 +393,25 @@ class Batch(GObject.GObject):
 				except Exception as e:
 					if e.args[0] == 'errors': errors += e.args[1]
 					else: raise
-		if errors > 0:
-			raise Exception('Encountered %d errors' % errors)
-		if self._command == 'rename':
-			for item in self.assign_base_numbers(): yield item
-			rename_order = []
-			try:
-				for file in self.calculate_rename_order():
-					if file is not None: rename_order.append(file)
-					yield
-			except Exception:
-				for group in self._files_by_group:
-					for file in self._files_by_group[group]._files:
-						if file.get_property(File.RENAMEERROR) is not None:
-							self._progresswindow.output('%s: %s\n' % (file.get_path(), file.get_property(File.RENAMEERROR)))
-							yield
-							errors += 1
-				raise Exception('Encountered %d problems. See output above.' % errors)
-			for item in self.assign_tag(): yield item
-			for item in self.rename_files(rename_order): yield item
-		self._progresswindow.set_visible(False)
+			if errors > 0:
+				raise Exception('Encountered %d errors' % errors)
+			if rename:
+				for item in self._report.measure('rename_files', self.rename_files(rename_order)): yield item
+			self._progresswindow.set_visible(False)
+		finally:
+			self.write_report()
+			if self._profiler is not None: self._profiler.close()
+			self.write_trace()
+
+	# Add selected files and directories to batch
+	def add_uris(self):
+		self._progresswindow.set_step('Searching selected directories ...', len(self._uris))
+		for uri in self._uris:
+			uri = self.prepare_uri(uri)
+			if not self.valid_uri(uri): continue
+			file = File.File(self, uri)
+			self._common_path = self.get_common_root(file)
+			for item in self._report.measure('add_files_recursively', self.add_files_recursively(file, self._command == 'postprocess')): yield item
 
 	# Add files recursively to batch
 	@trace
@@ -175,6 +427,7 @@ class Batch(GObject.GObject):
 					for item in self.add_files_recursively(child, postprocessing): yield item
 			except:
 				pass
+			if self._pipeline is not None: self._pipeline.set_scanned(file.get_uri())
 		# Filter non-media files
 		if type != Gio.FileType.REGULAR: return
 		# Add file to batch
@@ -182,9 +435,18 @@ class Batch(GObject.GObject):
 
 	# Add file to batch if it is a supported image/video
 	@trace
-	def add_file(self, file):
+	# stamp: stamp of the file if already known (see get_shard_result)
+	def add_file(self, file, stamp = None):
 		# Filter non-media files
 		if not file.get_property(File.TYPE) in [File.IMAGE, File.VIDEO]: return
+		# Reuse file of the previous prepare if it did not change (keeps metadata and selected actions)
+		if stamp is None: stamp = file.get_stamp()
+		previous = self._snapshot.get(file.get_uri(), None)
+		if previous is not None and stamp is not None and previous[0] == stamp:
+			file = previous[1]
+		else:
+			self._changed.append(file)
+		self._files_by_uri[file.get_uri()] = (stamp, file)
 		# Add file to batch
 		self._file_count = self._file_count + 1
 		if file.get_root() in self._files_by_root:
@@ -195,6 +457,52 @@ class Batch(GObject.GObject):
 			self._files_by_group[file.get_group()].add_file(file)
 		else:
 			self._files_by_group[file.get_group()] = FileGroup.FileGroup(file)
+		if self._pipeline is not None: self._pipeline.add_file(file)
+
+	# Determine roots and groups affected by added, changed or removed files since the previous prepare
+	def update_dirty(self):
+		if not self._snapshot:
+			self._dirty_roots = self._dirty_groups = None
+			return
+		changed = self._changed + [file for uri, (stamp, file) in self._snapshot.items() if uri not in self._files_by_uri]
+		self._dirty_groups = set([file.get_group() for file in changed])
+		# Group checks store results under the group (e.g. a new panorama result file)
+		self._dirty_roots = set([file.get_root() for file in changed]) | self._dirty_groups
+		for group in self._dirty_groups:
+			if group not in self._files_by_group: continue
+			self._dirty_roots.update([file.get_root() for file in self._files_by_group[group]._files])
+		logger.info('%d files changed since previous prepare, rechecking %d groups', len(changed), len(self._dirty_groups))
+
+	# Check whether checks have to run for files with root (None: all roots are dirty)
+	def is_dirty_root(self, root):
+		return self._dirty_roots is None or root in self._dirty_roots
+
+	# Check whether checks have to run for group
+	def is_dirty_group(self, group):
+		return self._dirty_groups is None or group in self._dirty_groups
+
+	# Check whether checks have to run for files with root (dirty and, in a pipelined prepare, in the directory being checked)
+	def is_check_root(self, root):
+		if self._check_roots is not None and root not in self._check_roots: return False
+		return self.is_dirty_root(root)
+
+	# Get roots the checks have to run for
+	def get_check_roots(self):
+		roots = self._check_roots if self._check_roots is not None else self._files_by_root
+		return [root for root in roots if self.is_check_root(root)]
+
+	# Get groups the checks have to run for
+	def get_check_groups(self):
+		groups = self._check_groups if self._check_groups is not None else self._files_by_group
+		return [group for group in groups if self.is_dirty_group(group)]
+
+	# Set progress step of a check (the checks of a pipelined prepare run per directory and share one step)
+	def set_check_step(self, text, count):
+		if self._check_roots is None: self._progresswindow.set_step(text, count)
+
+	# Step progress of a check
+	def increase_check_step(self, text):
+		if self._check_roots is None: self._progresswindow.increase_step(text)
 
 	# Initialize files by reading tags
 	@trace
@@ -224,9 +532,13 @@ class Batch(GObject.GObject):
 	@trace
 	def calculate_rename_order(self):
 		# Build rename graph
+		error = False
 		destination_uris = {}
 		source_uris = {}
 		source_counts = {}
+		# Sidecars follow their files (see File.rename)
+		sidecar_destinations = {}
+		sidecar_sources = set()
 		for group in self._files_by_group:
 			for file in self._files_by_group[group]._files:
 				yield
@@ -247,13 +559,34 @@ class Batch(GObject.GObject):
 				# Out degree
 				source_counts[src_uri] = source_counts.get(src_uri, 0) + 1
 				source_counts[dest_uri] = source_counts.get(dest_uri, 0)
+				# A shared sidecar is moved by one of its files, the others have to be renamed alike
+				problem = file.check_shared_sidecar()
+				if problem is not None:
+					file.add_properties({File.RENAMEERROR: problem})
+					logger.info('%s: %s' % (file.get_path(), problem))
+					error = True
+				sidecar_uri = file.get_sidecar_destination_uri()
+				if sidecar_uri is not None and src_uri != dest_uri:
+					sidecar_sources.add(file.get_sidecar().get_uri())
+					sidecar_destinations.setdefault(sidecar_uri, []).append(file)
+		# Check sidecar destinations (the order of their files is the order of the sidecars)
+		for uri in sidecar_destinations:
+			yield
+			files = sidecar_destinations[uri]
+			if len(files) > 1 or uri in destination_uris: message = 'Sidecar destination not unique'
+			# Sidecars of renamed files are moved away before
+			elif uri not in sidecar_sources and uri not in source_uris and Gio.File.new_for_uri(uri).query_exists(None): message = 'Sidecar destination exists'
+			else: continue
+			for file in files:
+				file.add_properties({File.RENAMEERROR: message})
+				logger.info('%s: %s %s' % (file.get_path(), message, uri))
+			error = True
 		# Get nodes with zero out degree
 		next_uris = []
 		for uri in source_counts:
 			if source_counts[uri] == 0: next_uris.append(uri)
 		# Calculate rename order
 		order = []
-		error = False
 		while len(next_uris) > 0:
 			uri = next_uris.pop()
 			for src in destination_uris.get(uri, []):
@@ -285,6 +618,17 @@ class Batch(GObject.GObject):
 				error = True
 		if error: raise Exception('Could not calculate rename order')
 
+	# Get destination shown in the preview and an icon name for its state
+	def get_preview(self, file):
+		if file.check_delete_action():
+			return ('<File will be deleted>', 'edit-delete')
+		dest = self.get_relative_path(file.get_destination())
+		if file.get_property(File.RENAMEERROR) is not None:
+			return (dest, 'process-stop')
+		elif file.get_uri() == file.get_destination_uri():
+			return (dest, 'change-prevent')
+		return (dest, '')
+
 	# Add the tag of the batch to its files metadata
 	@trace
 	def assign_tag(self):
@@ -296,7 +640,52 @@ class Batch(GObject.GObject):
 				yield
 				if file.check_delete_action(): continue
 				file.assign_tag(self._tag)
-				file.save()
+
+	# Write queued metadata changes (actions, tag), once per file, on a pool of worker threads
+	# Results are reported in file order; pause stops starting writes, cancel waits for running writes only
+	@trace
+	def save_modified_files(self):
+		files = [file for group in self._files_by_group for file in self._files_by_group[group]._files if file.is_modified() and not file.check_delete_action()]
+		self._progresswindow.set_step('Saving metadata ...', len(files))
+		jobs = max(self._limits.get(Scheduler.WRITE, 1), 1)
+		executor = concurrent.futures.ThreadPoolExecutor(max_workers = jobs, thread_name_prefix = 'save')
+		pending = collections.deque()
+		event = Event()
+		# Wake up the main loop when a write finished (events are not thread-safe)
+		def on_done(future):
+			GLib.idle_add(event.set)
+		paused = False
+		errors = 0
+		index = 0
+		try:
+			while index < len(files) or len(pending) > 0:
+				while not paused and index < len(files) and len(pending) < 2 * jobs:
+					future = executor.submit(files[index].save)
+					future.add_done_callback(on_done)
+					pending.append((files[index], future))
+					index += 1
+				while len(pending) > 0 and pending[0][1].done():
+					file, future = pending.popleft()
+					self._progresswindow.increase_step(file.get_path())
+					try:
+						future.result()
+					except Exception as e:
+						errors += 1
+						file.add_properties({File.ACTIONERROR: str(e)})
+						self._progresswindow.output('%s: %s\n' % (file.get_path(), e))
+				if len(pending) == 0:
+					# Nothing running: sleep while paused, otherwise continue starting writes
+					message = yield (100 if paused else None)
+				else:
+					if event.is_set(): event = Event()
+					# The write may have finished before the new event was created
+					if pending[0][1].done(): message = yield
+					else: message = yield event
+				paused = bool(message)
+		finally:
+			for file, future in pending: future.cancel()
+			executor.shutdown(wait = True)
+		if errors > 0: raise Exception('errors', errors)
 
 	# Rename the files in batch
 	@trace
@@ -308,12 +697,26 @@ class Batch(GObject.GObject):
 			if file.check_delete_action(): continue
 			file.rename()
 
+# File name pattern of panorama/HDR subgroups (e.g. IMG_0001(a).jpg, IMG_0001(b).jpg and IMG_0001.jpg form group IMG_0001)
+GROUP_PATTERN = re.compile(r'^(?P<group>.*?)(?P<index>((?<=[0-9])|\([a-z]*\)?)?\.[^.]*)$')
+
+# Number of batch runs in this process (part of the run id, the service may run several batches per second)
+RUN_COUNTER = itertools.count(1)
+
 GROUP_KEY = {
 	'by name': lambda item: item[0],
 	'by date': lambda item: item[1].get_creation_time(),
 }
 
+from . import Command
+from . import Config
 from . import File
 from . import FileAction
 from . import FileCheck
 from . import FileGroup
+from . import JobQueue
+from . import Pipeline
+from . import Profiler
+from . import Report
+from . import Scheduler
+from . import Shard
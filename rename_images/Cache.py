@@ -0,0 +1,75 @@
+import collections
+import logging
+import threading
+
+logger = logging.getLogger('Cache')
+
+# Least recently used cache; entries carry a stamp which has to match on lookup (e.g. mtime and size of a file)
+# max_entries: bound of the number of entries (None: only the sizes are bound)
+# max_bytes: bound of the summed sizes passed to put (0: only the number of entries is bound)
+class LRUCache:
+	def __init__(self, name, max_entries, max_bytes = 0):
+		self._name = name
+		self._max_entries = max_entries
+		self._max_bytes = max_bytes
+		self._bytes = 0
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+		self._hits = 0
+		self._misses = 0
+
+	# Get value for key if it is cached with the same stamp
+	def get(self, key, stamp = None):
+		with self._lock:
+			entry = self._entries.get(key, None)
+			if entry is None or entry[0] != stamp:
+				self._misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self._hits += 1
+			return entry[1]
+
+	# Store value for key, evicting the least recently used entries
+	# size: memory used by value in bytes (counts against max_bytes)
+	def put(self, key, value, stamp = None, size = 0):
+		if self._max_entries is not None and self._max_entries <= 0: return
+		if self._max_bytes > 0 and size > self._max_bytes: return
+		with self._lock:
+			self.drop(key)
+			self._entries[key] = (stamp, value, size)
+			self._bytes += size
+			while (self._max_entries is not None and len(self._entries) > self._max_entries) or (self._max_bytes > 0 and self._bytes > self._max_bytes):
+				key, entry = self._entries.popitem(last=False)
+				self._bytes -= entry[2]
+
+	# Check whether entries are kept at all
+	def is_enabled(self):
+		return self._max_entries is None or self._max_entries > 0
+
+	# Change bound of the number of entries, evicting the least recently used entries (0 disables the cache)
+	def set_max_entries(self, max_entries):
+		with self._lock:
+			self._max_entries = max_entries
+			while max_entries is not None and len(self._entries) > max(max_entries, 0):
+				key, entry = self._entries.popitem(last=False)
+				self._bytes -= entry[2]
+
+	# Drop entry for key (lock has to be held)
+	def drop(self, key):
+		entry = self._entries.pop(key, None)
+		if entry is not None: self._bytes -= entry[2]
+
+	# Drop entry for key
+	def remove(self, key):
+		with self._lock:
+			self.drop(key)
+
+	# Drop all entries
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self._bytes = 0
+
+	# Log hit rate
+	def log_statistics(self):
+		logger.info('%s cache: %d entries (%d KiB), %d hits, %d misses', self._name, len(self._entries), self._bytes // 1024, self._hits, self._misses)
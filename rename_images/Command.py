@@ -1,6 +1,9 @@
 from __future__ import with_statement
 
+import codecs
+import datetime
 import fcntl
+import itertools
 import logging
 import os
 import re
@@ -9,46 +12,121 @@ import string
 import subprocess
 import time
 
-from gi.repository import GObject, Gio, Gtk
-from .Annotations import trace
+from gi.repository import GObject, Gio, GLib, Gtk
+from .Annotations import Event, trace
+from . import Config
 
 logger = logging.getLogger('Command')
 
+# Numbering of log files within this process
+_log_counter = itertools.count(1)
+
+# Remove old log files whenever this many logs were created (and for the first one)
+LOG_PRUNE_INTERVAL = 100
+
 # Class executing a shell command redirecting input and output
 class Command(GObject.GObject):
+	# output: object displaying the output (e.g. ProgressWindow); the complete output is written to a log file per command
+	# label: prefix for each output line to keep output of concurrently running commands readable
+	# capture: keep output for get_captured_output
 	@trace
-	def __init__(self, output_buffer = None):
-		self._output_buffer = output_buffer
+	def __init__(self, output = None, label = None, capture = False):
+		self._output = output
+		self._label = label
+		self._partial = ''
+		self._captured = [] if capture else None
+		self._log = None
+
+	# Create log file receiving the complete output of the command
+	def open_log(self):
+		number = next(_log_counter)
+		if number % LOG_PRUNE_INTERVAL == 1: Config.prune_data_dir('logs', Config.KEEP_LOGS)
+		name = '%s-%d-%d-%s.log' % (datetime.datetime.now().strftime('%Y%m%d-%H%M%S'), os.getpid(), number, re.sub(r'[^\w.-]', '_', self._label or 'command'))
+		path = os.path.join(Config.get_data_dir('logs'), name)
+		try:
+			self._log = open(path, 'w', encoding='utf-8')
+		except OSError as e:
+			logger.warn('Could not create log file %s: %s', path, e)
+		return path
+
+	# Close log file
+	def close_log(self):
+		if self._log is None: return
+		self._log.close()
+		self._log = None
+
+	# Return output of process if it was captured
+	def get_captured_output(self):
+		return ''.join(self._captured or [])
 
 	@trace
 	def output(self, text):
-		self._output_buffer.insert(self._output_buffer.get_end_iter(), text)
+		if self._captured is not None: self._captured.append(text)
+		if self._log is not None: self._log.write(text)
+		if self._label is not None:
+			lines = (self._partial + text).split('\n')
+			self._partial = lines.pop()
+			text = ''.join(['[%s] %s\n' % (self._label, line) for line in lines])
+			if not text: return
+		if self._output is not None: self._output.output(text)
+
+	# Read available output of process and display it; returns False at end of output
+	def read_output(self):
+		while True:
+			try:
+				data = os.read(self._process.stdout.fileno(), 65536)
+			except BlockingIOError:
+				return True
+			except OSError:
+				return False
+			if not data: return False
+			self.output(self._decoder.decode(data))
+
+	# Output of process is available (called from main loop)
+	def on_output(self, source, condition):
+		if self.read_output(): return True
+		self._eof = True
+		self._event.set()
+		return False
+
+	# Process terminated (called from main loop, which also reaps the process)
+	def on_exit(self, pid, status):
+		self._process.returncode = os.waitstatus_to_exitcode(status)
+		self._event.set()
+
+	# Display incomplete last line
+	def flush_output(self):
+		if self._partial: self.output('\n')
 
 	@trace
 	def execute(self, *args):
+		path = self.open_log()
 		self.output('\n# %s\n' % " ".join(args))
+		if self._output is not None: self._output.output('# Log: %s\n' % path)
 		# Create process
 		args = ('/usr/bin/nice', '-n', '10', '/usr/bin/ionice', '-c', '3', '/usr/bin/setsid', '--wait') + args
 		self._process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 		# Make pipe nonblocking
 		flags = fcntl.fcntl(self._process.stdout.fileno(), fcntl.F_GETFL)
 		fcntl.fcntl(self._process.stdout.fileno(), fcntl.F_SETFL, flags | os.O_NONBLOCK)
+		self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
 		self._paused = None
-		# Wait for process termination
-		while self._process.poll() is None:
-			# Look for pipe output and display it
-			try:
-				self.output(self._process.stdout.read())
-			except Exception: pass
-			pause = yield 100
+		self._eof = False
+		self._event = Event()
+		# Let the main loop notify about output and termination
+		GLib.io_add_watch(self._process.stdout.fileno(), GLib.PRIORITY_DEFAULT, GLib.IOCondition.IN | GLib.IOCondition.HUP | GLib.IOCondition.ERR, self.on_output)
+		GLib.child_watch_add(GLib.PRIORITY_DEFAULT, self._process.pid, self.on_exit)
+		# Wait for process termination and end of output
+		while self._process.returncode is None or not self._eof:
+			if self._event.is_set(): self._event = Event()
+			pause = yield self._event
 			# Pause/resume process
 			if pause != self._paused:
 				logger.info('Process is %s, but should be %s. Singalling process ...', 'paused' if self._paused else 'running', 'paused' if pause else 'running')
 				os.killpg(self._process.pid, signal.SIGSTOP if pause else signal.SIGCONT)
 				self.output('\n +++ Process %s +++\n' % ('paused' if pause else 'resumed'))
 				self._paused = pause
-		try:
-			self.output(self._process.stdout.read())
-		except Exception: pass
+		self._process.stdout.close()
+		self.flush_output()
+		self.close_log()
 		if self._process.returncode != 0: raise Exception('command terminated with return code %d' % self._process.returncode)
-
@@ -1,21 +1,40 @@
 import getopt
 import logging
+import os
 import sys
 
-import gi
-gi.require_version('Gtk', '4.0')
-from gi.repository import Gtk 
-
 # Display syntax and quit
 def syntax():
 	print('Syntax: %s -p|-h|-g|-d|-x <files>' % sys.argv[0])
+	print('        %s -s' % sys.argv[0])
+	print('        %s --worker=<directory>' % sys.argv[0])
+	print('  -s  run resident service; later invocations open their batches in it')
+	print('  --jobs=<n>     number of CPU-heavy actions (conversions) running at once')
+	print('  --io-jobs=<n>  number of IO-heavy actions (rotations) running at once')
+	print('  --read-jobs=<n>   number of tag reads running at once (with --pipeline)')
+	print('  --write-jobs=<n>  number of metadata writes running at once')
+	print('  --memory-budget=<MiB>  memory available for concurrent panorama/HDR stitching')
+	print('  --orientation=pixels|metadata  rotate pixels (jhead) or only keep the orientation tags')
+	print('  --pipeline     read tags while scanning and check each directory once it is complete (also RENAME_IMAGES_PIPELINE=1)')
+	print('  --processes=<n>  prepare the subdirectories of the selected directories in n worker processes (with -x)')
+	print('  --queue=<directory>   run conversions on workers sharing the queue directory (also RENAME_IMAGES_QUEUE)')
+	print('  --worker=<directory>  run conversions queued in directory until interrupted')
+	print('  --profile      profile the batch with cProfile and tracemalloc (also RENAME_IMAGES_PROFILE=1)')
+	print('  --watch        keep watching the given directories and process new files once a directory settled (with -x)')
 	sys.exit(1)
 
-# Initialize application GUI
-def on_activate(app):
-	# Check commandline arguments
+# Parse commandline arguments into properties and files
+def parse_arguments():
 	mode = None
-	opts, args = getopt.getopt(sys.argv[1::], 'dhpgx')
+	properties = None
+	serve = False
+	watch = False
+	worker = None
+	options = {}
+	try:
+		opts, args = getopt.getopt(sys.argv[1::], 'dhpgxs', ['jobs=', 'io-jobs=', 'read-jobs=', 'write-jobs=', 'memory-budget=', 'orientation=', 'pipeline', 'processes=', 'queue=', 'worker=', 'profile', 'watch'])
+	except getopt.GetoptError:
+		syntax()
 	for opt, arg in opts:
 		if opt in ['-d', '-h', '-p', '-g', '-x']:
 			if mode != None: syntax()
@@ -27,7 +46,44 @@ def on_activate(app):
 				'-d': Mode.DATE,
 				'-x': Mode.POSTPROCESS,
 			}[mode]
-	if mode == None: syntax()
+		elif opt == '-s':
+			serve = True
+		elif opt in ['--jobs', '--io-jobs', '--read-jobs', '--write-jobs']:
+			if not arg.isdigit(): syntax()
+			# Keys are the resource classes of Scheduler (not imported to keep clients lightweight)
+			limits = options.setdefault('limits', {})
+			limits[{'--jobs': 'cpu', '--io-jobs': 'io', '--read-jobs': 'read', '--write-jobs': 'write'}[opt]] = int(arg)
+		elif opt == '--memory-budget':
+			if not arg.isdigit(): syntax()
+			options['memory_budget'] = int(arg)
+		elif opt == '--orientation':
+			if arg not in ['pixels', 'metadata']: syntax()
+			options['orientation'] = arg
+		elif opt == '--processes':
+			if not arg.isdigit(): syntax()
+			options['processes'] = int(arg)
+		elif opt == '--queue':
+			options['queue'] = os.path.abspath(arg)
+		elif opt == '--worker':
+			worker = arg
+		elif opt == '--pipeline':
+			options['pipeline'] = True
+		elif opt == '--profile':
+			options['profile'] = True
+		elif opt == '--watch':
+			watch = True
+	if serve or worker:
+		if mode != None or args or (serve and worker): syntax()
+	elif mode == None: syntax()
+	elif watch and (mode != '-x' or not args): syntax()
+	else:
+		properties = dict(properties)
+		properties.update(options)
+	return serve, watch, worker, mode, properties, args
+
+# Initialize application GUI
+def on_activate(app, mode, properties, args):
+	from . import FileActionWindow
 	# Initalize main window
 	logger.info('Starting mode %s with properties %s for files [%s]', mode, properties, ",".join(args))
 	FileActionWindow.FileActionWindow(app, None, properties, args).present()
@@ -43,11 +99,34 @@ def main():
 	logging.getLogger().setLevel(logging.DEBUG)
 	logger = logging.getLogger('renameimages')
 
+	# Check commandline arguments
+	serve, watch, worker, mode, properties, args = parse_arguments()
+	if serve:
+		sys.exit(Service.serve())
+	if worker:
+		import gi
+		gi.require_version('Gtk', '4.0')
+		from . import JobQueue
+		sys.exit(JobQueue.work(worker))
+	if watch:
+		import gi
+		gi.require_version('Gtk', '4.0')
+		from . import Watch
+		sys.exit(Watch.watch(args, properties))
+	# Hand batch over to resident service if one is running
+	if Service.submit(properties, args):
+		logger.info('Submitted mode %s for files [%s] to service', mode, ",".join(args))
+		return
+
+	# Import GUI lazily so submitting to the service stays lightweight
+	import gi
+	gi.require_version('Gtk', '4.0')
+	from gi.repository import Gtk
+
 	# Define and start application
 	app = Gtk.Application(application_id = 'de.ritscher.rename_images')
-	app.connect('activate', on_activate)
+	app.connect('activate', on_activate, mode, properties, args)
 	app.run(None)
 
-from . import FileActionWindow
 from . import Mode
-
+from . import Service
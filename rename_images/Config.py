@@ -0,0 +1,94 @@
+import logging
+import os
+
+logger = logging.getLogger('Config')
+
+# Read an integer setting from the environment
+def get_int(name, default):
+	try:
+		return int(os.environ.get(name, default))
+	except ValueError:
+		logger.warn('Ignoring invalid value %s=%s', name, os.environ[name])
+		return default
+
+# Directory for runtime files (e.g. the service socket)
+def get_runtime_dir():
+	return os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+
+# Directory for files kept after a run (e.g. logs), created on demand
+def get_data_dir(name):
+	base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+	path = os.path.join(base, 'rename_images', name)
+	os.makedirs(path, exist_ok=True)
+	return path
+
+# Remove the oldest files of a data directory, keeping the newest keep files (0: keep all)
+def prune_data_dir(name, keep):
+	if keep <= 0: return
+	files = []
+	for entry in os.scandir(get_data_dir(name)):
+		try:
+			if entry.is_file(): files.append((entry.stat().st_mtime, entry.path))
+		except OSError:
+			continue
+	files.sort()
+	for mtime, path in files[:-keep]:
+		try:
+			os.unlink(path)
+		except OSError as e:
+			logger.warn('Could not remove %s: %s', path, e)
+
+# Path of an external tool: RENAME_IMAGES_TOOL_<NAME> overrides a single tool, RENAME_IMAGES_TOOL_DIR all of them (e.g. benchmarks/stubs)
+def get_tool(name):
+	path = os.environ.get('RENAME_IMAGES_TOOL_' + name.upper().replace('-', '_'))
+	if path: return path
+	return os.path.join(os.environ.get('RENAME_IMAGES_TOOL_DIR') or '/usr/bin', name)
+
+# Unix socket of the resident service
+SOCKET_PATH = os.environ.get('RENAME_IMAGES_SOCKET', os.path.join(get_runtime_dir(), 'rename_images-%d.sock' % os.getuid()))
+# Number of tag reads running at once in a pipelined prepare
+READ_JOBS = get_int('RENAME_IMAGES_READ_JOBS', 4)
+# Number of metadata writes running at once
+WRITE_JOBS = get_int('RENAME_IMAGES_WRITE_JOBS', 4)
+# Maximum number of parsed metadata objects kept in memory by the service
+METADATA_CACHE_SIZE = get_int('RENAME_IMAGES_METADATA_CACHE', 10000)
+# Maximum number of directory listings kept in memory by the service
+DIRECTORY_CACHE_SIZE = get_int('RENAME_IMAGES_DIRECTORY_CACHE', 5000)
+# Memory budget for concurrently running jobs in MiB (0: 80% of the available memory)
+MEMORY_BUDGET = get_int('RENAME_IMAGES_MEMORY_BUDGET', 0)
+# Do not start further memory-heavy jobs while tasks stall on memory more than this share of time (percent)
+MEMORY_PRESSURE_LIMIT = get_int('RENAME_IMAGES_MEMORY_PRESSURE', 10)
+# Estimated peak memory of panorama/HDR stitching per input pixel in bytes
+STITCH_BYTES_PER_PIXEL = get_int('RENAME_IMAGES_STITCH_BYTES_PER_PIXEL', 16)
+# Memory for thumbnails of the rename preview in MiB
+THUMBNAIL_CACHE_SIZE = get_int('RENAME_IMAGES_THUMBNAIL_CACHE', 64)
+# Edge length of thumbnails in the rename preview in pixels
+THUMBNAIL_SIZE = get_int('RENAME_IMAGES_THUMBNAIL_SIZE', 64)
+# Number of thumbnails loaded at once
+THUMBNAIL_JOBS = get_int('RENAME_IMAGES_THUMBNAIL_JOBS', 2)
+# Number of lines of command output kept in the progress window (complete output is in the log files)
+OUTPUT_LINES = get_int('RENAME_IMAGES_OUTPUT_LINES', 2000)
+# Number of command log files kept in the logs directory (0: all)
+KEEP_LOGS = get_int('RENAME_IMAGES_KEEP_LOGS', 1000)
+# Number of performance reports kept in the reports directory (0: all; watch mode writes one per cycle)
+KEEP_REPORTS = get_int('RENAME_IMAGES_KEEP_REPORTS', 200)
+# External tools called by file actions
+TOOLS = dict([(name, get_tool(name)) for name in ['recodevideos', 'convert-raw', 'postprocess-photo', 'jhead']])
+# Seconds without changes in a directory before watch mode processes it
+WATCH_SETTLE = get_int('RENAME_IMAGES_WATCH_SETTLE', 10)
+# Prepare as a pipeline: read tags while scanning and check directories as soon as their tags were read
+PIPELINE = get_int('RENAME_IMAGES_PIPELINE', 0) > 0
+# Number of worker processes preparing the subdirectories of a recursive batch (0 or 1: prepare in this process)
+PROCESSES = get_int('RENAME_IMAGES_PROCESSES', 0)
+# Python interpreter running these worker processes (None: this interpreter, or python3.x from PATH when embedded, e.g. in Nautilus)
+PYTHON = os.environ.get('RENAME_IMAGES_PYTHON') or None
+# Directory shared with queue workers running conversions (None: run them here)
+QUEUE = os.environ.get('RENAME_IMAGES_QUEUE') or None
+# Seconds after which a job claimed by a worker is submitted again unless the worker renews its claim
+QUEUE_LEASE = get_int('RENAME_IMAGES_QUEUE_LEASE', 60)
+# Milliseconds between checks for new jobs and results
+QUEUE_POLL = get_int('RENAME_IMAGES_QUEUE_POLL', 1000)
+# Profile batch runs with cProfile and tracemalloc (e.g. for runs started from Nautilus)
+PROFILE = get_int('RENAME_IMAGES_PROFILE', 0) > 0
+# Number of stack frames stored per allocation when profiling
+PROFILE_FRAMES = get_int('RENAME_IMAGES_PROFILE_FRAMES', 10)
@@ -0,0 +1,48 @@
+import logging
+import sys
+
+from gi.repository import GObject
+from .Annotations import Event
+
+logger = logging.getLogger('ConsoleProgress')
+
+# Progress reporting without GUI (e.g. benchmarks and background runs); same interface as ProgressWindow
+class ConsoleProgress(GObject.GObject):
+	# output: stream for command output (None: discard it)
+	def __init__(self, output = sys.stdout):
+		GObject.GObject.__init__(self)
+		self._output = output
+		self._count = 1
+		self._index = 0
+		self._interrupt = Event()
+
+	def set_title(self, title):
+		logger.info(title)
+
+	def set_visible(self, visible):
+		pass
+
+	# Set progress text
+	def set_step(self, text, count=1, progress_text=None):
+		logger.debug(text)
+		self._count = count if count > 0 else 1
+		self._index = 0
+
+	# Step progress
+	def increase_step(self, progress_text=None):
+		self._index = self._index + 1
+
+	# Increase number of total steps
+	def increase_count(self, count):
+		self._count = self._count + count
+
+	# Write command output
+	def output(self, text):
+		if self._output is not None: self._output.write(text)
+
+	# There is no pause or cancel button
+	def get_interrupt_event(self):
+		return self._interrupt
+
+	def check_pause_cancel(self):
+		return False
@@ -6,13 +6,19 @@ import logging
 import os
 import re
 import string
+import threading
 
 gi.require_version('GExiv2', '0.10')
-from gi.repository import GObject, Gio, GLib, GExiv2
+from gi.repository import GObject, Gio, GLib, GExiv2, GdkPixbuf
 from .Annotations import trace
+from .Cache import LRUCache
+from . import Config
 
 logger = logging.getLogger('File')
 
+# Initialize exiv2 once before any thread uses it (tags are read on worker threads, see Pipeline and save_modified_files)
+if not GExiv2.initialize(): raise Exception('Could not initialize GExiv2')
+
 # Class containing a single image/video file in a batch
 class File(GObject.GObject):
 	def __init__(self, batch, uri):
@@ -38,6 +44,8 @@ class File(GObject.GObject):
 		self._file_type = None
 		self._creation_time = None
 		self._metadata = None
+		self._metadata_shared = False
+		self._writes = []
 		self._properties = {}
 
 	# Add default properties by extension
@@ -45,6 +53,9 @@ class File(GObject.GObject):
 		ext = self.get_extension().lower()
 		if ext in EXTENSIONS:
 			for key, value in EXTENSIONS[ext].items():
+				# Orientation by metadata only instead of rotating pixels
+				if value is FileAction.Rotate and self._batch._orientation == 'metadata':
+					value = FileAction.SetOrientation
 				if 'is_postprocessing' in dir(value) and value.is_postprocessing() and not postprocessing:
 					value = FileAction.Ignore
 				self.add_properties({key: value})
@@ -65,8 +76,80 @@ class File(GObject.GObject):
 		if self._metadata != None:
 			return
 		if self.get_property(TAGS):
-			self._metadata = GExiv2.Metadata()
-			self._metadata.open_path(self.get_path())
+			stamp = self.get_stamp()
+			self._metadata = METADATA_CACHE.get(self.get_uri(), stamp)
+			if self._metadata is not None:
+				self._metadata_shared = True
+				return
+			self._metadata = self.open_metadata()
+			if stamp is not None and METADATA_CACHE.is_enabled():
+				METADATA_CACHE.put(self.get_uri(), self._metadata, stamp)
+				self._metadata_shared = True
+
+	# Load exif/xmp tags again after the file was modified externally; queued changes still apply
+	def reload_tags(self):
+		METADATA_CACHE.remove(self.get_uri())
+		self._metadata = None
+		self._metadata_shared = False
+		self.read_tags()
+		if len(self._writes) > 0:
+			self.own_metadata()
+			for function, args in self._writes: function(self._metadata, *args)
+
+	# Get a private copy of the metadata before modifying it (cached metadata may be shared with other batches)
+	def own_metadata(self):
+		if not self._metadata_shared: return
+		METADATA_CACHE.remove(self.get_uri())
+		self._metadata = self.open_metadata()
+		self._metadata_shared = False
+
+	# Open exif/xmp tags of the file merged with its sidecar (if any)
+	def open_metadata(self):
+		metadata = GExiv2.Metadata()
+		metadata.open_path(self.get_path())
+		sidecar = self.get_sidecar()
+		if sidecar is not None and sidecar.query_exists(None): merge_sidecar(metadata, sidecar.get_path())
+		return metadata
+
+	# Get XMP sidecar file receiving metadata changes instead of the file itself (None if not used for the file type)
+	def get_sidecar(self):
+		if not self.get_property(SIDECAR): return None
+		return Gio.File.new_for_uri(self.get_root() + SIDECAR_EXTENSION)
+
+	# Get files of the group sharing the sidecar of this file, including it, ordered by uri
+	# Files of different types may share one (e.g. IMG_0001.cr2 and IMG_0001.nef both use IMG_0001.xmp)
+	def get_sidecar_files(self):
+		if self._group is None or not self.get_property(SIDECAR): return [self]
+		return sorted([file for file in self._group._files if file.get_property(SIDECAR) and file.get_root() == self.get_root()], key = lambda file: file.get_uri())
+
+	# Get file moving the (shared) sidecar on rename: the first of its files which is not deleted
+	def get_sidecar_owner(self):
+		files = [file for file in self.get_sidecar_files() if file is self or not file.check_delete_action()]
+		return files[0]
+
+	# Get sidecar to be removed together with this file (None if there is none or another file keeps using it)
+	def get_removed_sidecar(self):
+		sidecar = self.get_sidecar()
+		if sidecar is None or not sidecar.query_exists(None): return None
+		kept = [file for file in self.get_sidecar_files() if file is not self and not file.check_delete_action()]
+		if len(kept) > 0:
+			logger.info('Keeping sidecar %s of %s used by %s', sidecar.get_uri(), self.get_path(), kept[0].get_path())
+			return None
+		return sidecar
+
+	# Change metadata in memory and queue the change for save(), which writes the file once
+	# function(metadata, *args) is applied again to the file's current metadata when saving (e.g. after jhead modified it)
+	def queue_write(self, function, *args):
+		self.own_metadata()
+		function(self._metadata, *args)
+		self._writes.append((function, args))
+
+	# Get modification time and size to detect changes of the file (and its sidecar)
+	def get_stamp(self):
+		stamp = get_file_stamp(self._file)
+		sidecar = self.get_sidecar()
+		if stamp is None or sidecar is None: return stamp
+		return stamp + (get_file_stamp(sidecar),)
 
 	# Return path
 	def get_uri(self):
@@ -76,6 +159,10 @@ class File(GObject.GObject):
 	def get_path(self):
 		return self._file.get_path()
 
+	# Return file name without directory
+	def get_name(self):
+		return self._file.get_basename()
+
 	# Get the file extension
 	def get_extension(self):
 		root, ext = os.path.splitext(self._file.get_uri())
@@ -156,9 +243,18 @@ class File(GObject.GObject):
 
 	# Return children of directory
 	def enumerate_children(self):
-		for fileinfo in self._file.enumerate_children(Gio.FILE_ATTRIBUTE_STANDARD_NAME, Gio.FileQueryInfoFlags.NONE, None):
-			uri = self._file.get_child(fileinfo.get_name()).get_uri()
-			yield File(self._batch, uri)
+		stamp = self.get_stamp()
+		children = DIRECTORY_CACHE.get(self.get_uri(), stamp)
+		if children is None:
+			children = []
+			for fileinfo in self._file.enumerate_children(Gio.FILE_ATTRIBUTE_STANDARD_NAME + ',' + Gio.FILE_ATTRIBUTE_STANDARD_TYPE, Gio.FileQueryInfoFlags.NONE, None):
+				children.append((fileinfo.get_name(), fileinfo.get_file_type()))
+			if stamp is not None:
+				DIRECTORY_CACHE.put(self.get_uri(), children, stamp)
+		for name, file_type in children:
+			child = File(self._batch, self._file.get_child(name).get_uri())
+			child._file_type = file_type
+			yield child
 
 	# Get property by key
 	def get_property(self, key):
@@ -173,11 +269,32 @@ class File(GObject.GObject):
 		dest = self.get_destination_uri()
 		return Gio.File.new_for_uri(dest).query_exists()
 
-	# Rename file using the destination path
+	# Get destination of the sidecar following the file on rename (None if the file has no sidecar or shares the sidecar
+	# with a file moving it, see get_sidecar_owner)
+	def get_sidecar_destination_uri(self):
+		sidecar = self.get_sidecar()
+		if sidecar is None or self.get_sidecar_owner() is not self or not sidecar.query_exists(None): return None
+		return os.path.splitext(self.get_destination_uri())[0] + SIDECAR_EXTENSION
+
+	# Check whether a shared sidecar can follow the file on rename; returns the problem or None
+	def check_shared_sidecar(self):
+		owner = self.get_sidecar_owner()
+		if owner is self or os.path.splitext(self.get_destination_uri())[0] == os.path.splitext(owner.get_destination_uri())[0]: return None
+		return 'Sidecar %s is shared with %s, which is renamed differently' % (os.path.basename(self.get_root()) + SIDECAR_EXTENSION, owner.get_path())
+
+	# Rename file using the destination path; its sidecar follows (the file is moved back if the sidecar cannot)
 	def rename(self):
 		src = self._file.get_uri()
 		dest = self.get_destination_uri()
 		if src == dest: return
+		sidecar = self.get_sidecar()
+		sidecar_dest = self.get_sidecar_destination_uri()
+		if sidecar_dest is not None:
+			sidecar_dest = Gio.File.new_for_uri(sidecar_dest)
+			# Fail before touching the file (calculate_rename_order checks this too, but the disk may have changed since)
+			if sidecar_dest.query_exists(None):
+				logger.error('Could not rename %s to %s: destination exists.' % (sidecar.get_uri(), sidecar_dest.get_uri()))
+				raise Exception('Could not rename %s to %s: destination exists.' % (sidecar.get_uri(), sidecar_dest.get_uri()))
 		logger.info('Renaming %s to %s', src, dest)
 		try:
 			if not self._file.move(Gio.File.new_for_uri(dest), Gio.FileCopyFlags.NONE, None, None, None):
@@ -185,6 +302,16 @@ class File(GObject.GObject):
 		except Exception as e:
 			logger.error('Could not rename %s to %s: %s.' % (src, dest, e))
 			raise
+		if sidecar_dest is None: return
+		logger.info('Renaming %s to %s', sidecar.get_uri(), sidecar_dest.get_uri())
+		try:
+			sidecar.move(sidecar_dest, Gio.FileCopyFlags.NONE, None, None, None)
+		except GLib.Error as e:
+			logger.error('Could not rename %s to %s: %s.' % (sidecar.get_uri(), sidecar_dest.get_uri(), e))
+			# Keep file and sidecar together
+			logger.info('Renaming %s back to %s', dest, src)
+			Gio.File.new_for_uri(dest).move(self._file, Gio.FileCopyFlags.NONE, None, None, None)
+			raise
 
 
 	# Delete file
@@ -196,6 +323,8 @@ class File(GObject.GObject):
 		except Exception as e:
 			logger.error('Could not trash %s: %s', self._file.get_uri(), e)
 			raise
+		sidecar = self.get_removed_sidecar()
+		if sidecar is not None: sidecar.delete(None)
 
 	# Move file to trash; optionally delete if trash is not supported
 	def trash(self, delete_if_not_supported):
@@ -212,6 +341,8 @@ class File(GObject.GObject):
 		except Exception as e:
 			logger.error('Could not trash %s: %s', self._file.get_uri(), e)
 			raise
+		sidecar = self.get_removed_sidecar()
+		if sidecar is not None: sidecar.trash(None)
 
 	# Check whether file has a delete action
 	def check_delete_action(self):
@@ -253,9 +384,7 @@ class File(GObject.GObject):
 	def assign_tag(self, tag):
 		if not self.get_property(TAGS): return
 		for key in TAG_KEYS:
-			tags = self._metadata.get_tag_multiple(key)
-			tags.append(tag)
-			self._metadata.set_tag_multiple(key, tags)
+			self.queue_write(append_tag, key, tag)
 
 	# Parse date/time string
 	def parse_time_string(self, time):
@@ -288,17 +417,167 @@ class File(GObject.GObject):
 	# Set creation time in file metadata
 	@trace
 	def set_creation_time(self, key, time):
-		self._metadata.set_tag_string(key, time.strftime(TIME_FORMAT))
+		self.queue_write(GExiv2.Metadata.set_tag_string, key, time.strftime(TIME_FORMAT))
 
 	# Get file orientation
 	@trace
 	def get_orientation(self):
-		return self._metadata.get_tag_long('Exif.Image.Orientation')
+		return self._metadata.get_tag_long(ORIENTATION_KEYS[0])
+
+	# Write orientation consistently to the orientation tags without touching the pixels
+	# Only missing or differing tags are written; returns whether the file has to be saved for it
+	@trace
+	def set_orientation(self, orientation):
+		changed = False
+		for key in ORIENTATION_KEYS:
+			if not self._metadata.has_tag(key):
+				if key.startswith('Exif.Thumbnail.'): continue
+			elif self._metadata.get_tag_long(key) == orientation: continue
+			self.queue_write(GExiv2.Metadata.set_tag_long, key, orientation)
+			changed = True
+		return changed
+
+	# Get cached thumbnail of at most size pixels (None if it was not loaded yet)
+	def get_cached_thumbnail(self, size):
+		return THUMBNAIL_CACHE.get((self.get_uri(), size), self.get_stamp())
+
+	# Load thumbnail of at most size pixels from the embedded preview, for JPEGs without one from the image itself
+	# Thread-safe (reads the file without the batch's metadata); None if there is none or it cannot be read
+	def load_thumbnail(self, size):
+		if self.get_property(TYPE) != IMAGE: return None
+		stamp = self.get_stamp()
+		thumbnail = THUMBNAIL_CACHE.get((self.get_uri(), size), stamp)
+		if thumbnail is not None: return thumbnail
+		try:
+			thumbnail = read_thumbnail(self.get_path(), size, self.get_extension().lower() in THUMBNAIL_EXTENSIONS)
+		except GLib.Error as e:
+			logger.info('Cannot read thumbnail of %s: %s', self.get_path(), e)
+			return None
+		if thumbnail is not None and stamp is not None:
+			THUMBNAIL_CACHE.put((self.get_uri(), size), thumbnail, stamp, thumbnail.get_byte_length())
+		return thumbnail
+
+	# Check whether metadata was changed but not saved yet
+	def is_modified(self):
+		return len(self._writes) > 0
+
+	# Get number of pixels of image (estimated if unknown)
+	def get_pixel_count(self):
+		if self._metadata is not None:
+			pixels = self._metadata.get_pixel_width() * self._metadata.get_pixel_height()
+			if pixels > 0: return pixels
+		return DEFAULT_PIXEL_COUNT
 
 	# Save changes of metadata to file
 	@trace
 	def save(self):
-		self._metadata.save_file(self.get_path())
+		if len(self._writes) == 0: return
+		sidecar = self.get_sidecar()
+		if sidecar is not None: return self.save_sidecar(sidecar)
+		# Apply queued changes to the metadata currently in the file, then write it once
+		metadata = GExiv2.Metadata()
+		metadata.open_path(self.get_path())
+		for function, args in self._writes: function(metadata, *args)
+		metadata.save_file(self.get_path())
+		METADATA_CACHE.remove(self.get_uri())
+		self._metadata = metadata
+		self._metadata_shared = False
+		self._writes = []
+
+	# Write queued changes to the XMP sidecar, leaving the file itself untouched (exif/iptc keys are mapped to xmp)
+	@trace
+	def save_sidecar(self, sidecar):
+		# Files sharing the sidecar are saved by different writers (see get_sidecar_files)
+		with SIDECAR_LOCKS[hash(sidecar.get_path()) % len(SIDECAR_LOCKS)]:
+			if not sidecar.query_exists(None):
+				with open(sidecar.get_path(), 'w', encoding = 'utf-8') as f:
+					f.write(EMPTY_XMP)
+			metadata = GExiv2.Metadata()
+			metadata.open_path(sidecar.get_path())
+			for function, args in self._writes:
+				args = get_sidecar_args(args)
+				if args is not None: function(metadata, *args)
+			metadata.save_file(sidecar.get_path())
+		# The in-memory metadata already contains the changes
+		METADATA_CACHE.remove(self.get_uri())
+		self._writes = []
+
+# Read thumbnail of image at path scaled to at most size pixels (see File.load_thumbnail)
+# decode_image: decode the image itself if it has no embedded preview (only cheap for JPEGs, which decode scaled)
+def read_thumbnail(path, size, decode_image):
+	metadata = GExiv2.Metadata()
+	metadata.open_path(path)
+	# Smallest preview which is large enough, the largest one otherwise
+	previews = sorted(metadata.get_preview_properties() or [], key = lambda preview: preview.get_width() * preview.get_height())
+	fitting = [preview for preview in previews if max(preview.get_width(), preview.get_height()) >= size]
+	if fitting: data = metadata.get_preview_image(fitting[0]).get_data()
+	elif previews: data = metadata.get_preview_image(previews[-1]).get_data()
+	elif decode_image:
+		with open(path, 'rb') as f: data = f.read()
+	else: return None
+	loader = GdkPixbuf.PixbufLoader()
+	# Decode at the reduced size right away
+	def on_size_prepared(loader, width, height):
+		scale = min(1.0, float(size) / max(width, height, 1))
+		loader.set_size(max(1, int(width * scale)), max(1, int(height * scale)))
+	loader.connect('size-prepared', on_size_prepared)
+	try:
+		loader.write(data)
+	finally:
+		loader.close()
+	thumbnail = loader.get_pixbuf()
+	if thumbnail is None: return None
+	# Previews are stored unrotated
+	orientation = metadata.get_tag_long(ORIENTATION_KEYS[0]) if metadata.has_tag(ORIENTATION_KEYS[0]) else 1
+	if orientation in THUMBNAIL_ROTATION: thumbnail = thumbnail.rotate_simple(THUMBNAIL_ROTATION[orientation])
+	return thumbnail
+
+# Get modification time and size of a Gio.File (None if it does not exist)
+def get_file_stamp(file):
+	try:
+		fileinfo = file.query_info('time::modified,time::modified-usec,standard::size', Gio.FileQueryInfoFlags.NONE, None)
+	except GLib.Error:
+		return None
+	return (fileinfo.get_attribute_uint64('time::modified'), fileinfo.get_attribute_uint32('time::modified-usec'), fileinfo.get_size())
+
+# Convert time string between exif and xmp format (unchanged if it does not match)
+def convert_time(value, source, destination):
+	try:
+		return datetime.datetime.strptime(value, source).strftime(destination)
+	except ValueError:
+		return value
+
+# Map arguments (key, value, ...) of a queued change to the sidecar (None if the key has no xmp equivalent)
+def get_sidecar_args(args):
+	key = args[0]
+	if key.startswith('Xmp.'): return args
+	sidecar_key = SIDECAR_KEYS.get(key, None)
+	if sidecar_key is None: return None
+	if key in TIME_KEYS: return (sidecar_key, convert_time(args[1], TIME_FORMAT, XMP_TIME_FORMAT)) + tuple(args[2:])
+	return (sidecar_key,) + tuple(args[1:])
+
+# Merge tags of an XMP sidecar into metadata (in memory); sidecar values win, keywords are combined
+def merge_sidecar(metadata, path):
+	sidecar = GExiv2.Metadata()
+	sidecar.open_path(path)
+	for key in sidecar.get_xmp_tags():
+		if GExiv2.Metadata.get_tag_type(key) in ['XmpBag', 'XmpSeq']:
+			values = metadata.get_tag_multiple(key)
+			metadata.set_tag_multiple(key, values + [value for value in sidecar.get_tag_multiple(key) if value not in values])
+		else:
+			metadata.set_tag_string(key, sidecar.get_tag_string(key))
+	# Make sidecar values visible under the exif keys the rest of the code reads
+	for key, sidecar_key in SIDECAR_KEYS.items():
+		if not key.startswith('Exif.') or not sidecar.has_tag(sidecar_key): continue
+		value = sidecar.get_tag_string(sidecar_key)
+		if key in TIME_KEYS: value = convert_time(value, XMP_TIME_FORMAT, TIME_FORMAT)
+		metadata.set_tag_string(key, value)
+
+# Append value to a multi-value tag (queued by assign_tag)
+def append_tag(metadata, key, value):
+	values = metadata.get_tag_multiple(key)
+	values.append(value)
+	metadata.set_tag_multiple(key, values)
 
 # Convert a number to letter-count (0 -> a, 1 -> b, ..., 26 -> aa, 27 -> ab, ...)
 def number2alpha(number):
@@ -312,6 +591,20 @@ def number2alpha(number):
 from . import FileAction
 from . import FileCheck
 
+# Parsed metadata and directory listings shared between batches (enabled by the service, see Service.serve)
+METADATA_CACHE = LRUCache('Metadata', 0)
+DIRECTORY_CACHE = LRUCache('Directory', 0)
+# Thumbnails of the rename preview, bound by their memory
+THUMBNAIL_CACHE = LRUCache('Thumbnail', None, Config.THUMBNAIL_CACHE_SIZE * 1024 * 1024)
+# Images decoded for thumbnails if they have no embedded preview
+THUMBNAIL_EXTENSIONS = ['.jpg']
+# Rotation of thumbnails by EXIF orientation (mirrored orientations are shown unmirrored)
+THUMBNAIL_ROTATION = {
+	3: GdkPixbuf.PixbufRotation.UPSIDEDOWN,
+	6: GdkPixbuf.PixbufRotation.CLOCKWISE,
+	8: GdkPixbuf.PixbufRotation.COUNTERCLOCKWISE,
+}
+
 # Standard properties by extension
 TYPE = 'type'
 IMAGE = 'image'
@@ -326,14 +619,33 @@ DATEPRIO = 'dateprio'
 GROUPCONVERT = 'groupconvert'
 CREATIONTIME = 'creationtime'
 RENAMEERROR = 'renameerror'
+ACTIONERROR = 'actionerror'
+SIDECAR = 'sidecar'
 TAG_KEYS = ['Iptc.Application2.Keywords', 'Xmp.dc.subject']
 TIME_KEYS = ['Exif.Photo.DateTimeOriginal', 'Exif.Photo.DateTimeDigitized', 'Exif.Image.DateTime']
 TIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+ORIENTATION_KEYS = ['Exif.Image.Orientation', 'Xmp.tiff.Orientation', 'Exif.Thumbnail.Orientation']
+DEFAULT_PIXEL_COUNT = 24000000
+XMP_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# Sidecars are named like the file with extension .xmp (e.g. IMG_0001.xmp for IMG_0001.cr2)
+SIDECAR_EXTENSION = '.xmp'
+# Locks serializing writes of a sidecar (chosen by hash of its path)
+SIDECAR_LOCKS = [threading.Lock() for index in range(16)]
+# XMP keys taking changes of exif/iptc keys in sidecars (None: not written to sidecars)
+SIDECAR_KEYS = {
+	'Exif.Photo.DateTimeOriginal': 'Xmp.exif.DateTimeOriginal',
+	'Exif.Photo.DateTimeDigitized': 'Xmp.exif.DateTimeDigitized',
+	'Exif.Image.DateTime': 'Xmp.xmp.ModifyDate',
+	'Exif.Image.Orientation': 'Xmp.tiff.Orientation',
+	'Exif.Thumbnail.Orientation': None,
+	'Iptc.Application2.Keywords': None,
+}
+EMPTY_XMP = '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?><x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"/></x:xmpmeta><?xpacket end="w"?>\n'
 
 EXTENSIONS = {
 	'.jpg': {TYPE: IMAGE, STEP: RESULT, TAGS: True, ROTATE: True, GROUPCONVERT: True, DATEPRIO: 1, FileCheck.Unselected: FileAction.Include, FileCheck.Rotate: FileAction.Rotate, FileCheck.NewFileGroup: FileAction.ConvertGroup, FileCheck.CreationTime: FileAction.SetCreationTime},
-	'.cr2': {TYPE: IMAGE, STEP: RAW, TAGS: True, DATEPRIO: 2, FileCheck.OnlyRaw: FileAction.Trash, FileCheck.Unselected: FileAction.Include, FileCheck.CreationTime: FileAction.SetCreationTime},
-	'.nef': {TYPE: IMAGE, STEP: RAW, TAGS: True, DATEPRIO: 2, FileCheck.OnlyRaw: FileAction.Trash, FileCheck.Unselected: FileAction.Include, FileCheck.CreationTime: FileAction.SetCreationTime},
+	'.cr2': {TYPE: IMAGE, STEP: RAW, TAGS: True, SIDECAR: True, DATEPRIO: 2, FileCheck.OnlyRaw: FileAction.Trash, FileCheck.Unselected: FileAction.Include, FileCheck.CreationTime: FileAction.SetCreationTime},
+	'.nef': {TYPE: IMAGE, STEP: RAW, TAGS: True, SIDECAR: True, DATEPRIO: 2, FileCheck.OnlyRaw: FileAction.Trash, FileCheck.Unselected: FileAction.Include, FileCheck.CreationTime: FileAction.SetCreationTime},
 	'.tif': {TYPE: IMAGE, STEP: INTERMEDIATE, TAGS: True, DATEPRIO: 3, FileCheck.Unselected: FileAction.Include, FileCheck.CreationTime: FileAction.SetCreationTime},
 	'.mov': {TYPE: VIDEO, STEP: RAW, DATEPRIO: 5, FileCheck.OnlyRaw: FileAction.Convert, FileCheck.Unselected: FileAction.Include},
 	'.mp4': {TYPE: VIDEO, STEP: RESULT, DATEPRIO: 4, FileCheck.Unselected: FileAction.Include},
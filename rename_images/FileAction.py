@@ -1,4 +1,5 @@
 import logging
+import os
 
 from gi.repository import GObject, Gio
 from .Annotations import trace
@@ -20,12 +21,38 @@ class Action(GObject.GObject):
 	def is_postprocessing(cls):
 		pass
 
+	# Return whether action removes files (not run without review, e.g. in watch mode)
+	@classmethod
+	def is_destructive(cls):
+		return False
+
+	# Return resource class limiting how many of these actions run concurrently
+	@classmethod
+	def get_resource(cls):
+		return Scheduler.INLINE
+
+	# Estimate relative run time and peak memory in bytes of action for a file
+	@classmethod
+	def estimate(cls, file):
+		return (0, 0)
+
+	# Return key of files which can be handled by one execute_batch call (None: execute files one by one)
+	@classmethod
+	def get_batch_key(cls, file):
+		return None
+
 	# Execute action for a file in a batch
 	@classmethod
 	@trace
 	def execute(cls, file, batch):
 		yield
 
+	# Execute action for several files with the same batch key; errors are stored in the ACTIONERROR property of the files
+	@classmethod
+	@trace
+	def execute_batch(cls, files, batch):
+		yield
+
 class Convert(Action):
 	@classmethod
 	def get_text(self, file = None):
@@ -36,16 +63,21 @@ class Convert(Action):
 	def is_postprocessing(cls):
 		return True
 
+	# Return resource class limiting how many of these actions run concurrently
+	@classmethod
+	def get_resource(cls):
+		return Scheduler.CPU
+
 	# Convert file (RAW -> result)
 	@classmethod
 	@trace
 	def execute(cls, file, batch):
 		ext = file.get_extension().lower()
-		command = Command.Command(batch._progresswindow.get_output_buffer())
+		command = batch.get_command(file.get_name())
 		if ext == ".mov":
-			generator = command.execute('/usr/bin/recodevideos', file.get_path())
+			generator = command.execute(Config.TOOLS['recodevideos'], file.get_path())
 		elif ext == ".cr2":
-			generator = command.execute('/usr/bin/convert-raw', file.get_path())
+			generator = command.execute(Config.TOOLS['convert-raw'], file.get_path())
 		else:
 			raise Exception('Converting %s not implemented yet' % s)
 		# Better use (supported from python 3.3): yield from ...
@@ -67,6 +99,11 @@ class Trash(Action):
 	def is_postprocessing(cls):
 		return False
 
+	# Return whether action removes files
+	@classmethod
+	def is_destructive(cls):
+		return True
+
 	# Trash file
 	@classmethod
 	@trace
@@ -74,6 +111,31 @@ class Trash(Action):
 		file.trash(True)
 		yield
 
+	# Trash all files of a device together (same trash directory)
+	@classmethod
+	def get_batch_key(cls, file):
+		try:
+			return os.stat(file.get_path()).st_dev
+		except OSError:
+			return None
+
+	# Trash files in bulk with their sidecars; falls back to deleting them if the device has no trash
+	@classmethod
+	@trace
+	def execute_batch(cls, files, batch):
+		paths = {}
+		for file in files:
+			paths[file.get_path()] = file
+			sidecar = file.get_sidecar()
+			if sidecar is not None and sidecar.query_exists(None): paths[sidecar.get_path()] = file
+		for path, error in TrashCan.trash_paths(list(paths.keys()), True):
+			if error is not None:
+				file = paths[path]
+				logger.error('Could not trash %s: %s', path, error)
+				errors = file.get_property(File.ACTIONERROR)
+				file.add_properties({File.ACTIONERROR: '%s; %s' % (errors, error) if errors else error})
+			yield
+
 class Rotate(Action):
 	@classmethod
 	def get_text(self, file = None):
@@ -84,12 +146,17 @@ class Rotate(Action):
 	def is_postprocessing(cls):
 		return True
 
-	# Include file into batch
+	# Return resource class limiting how many of these actions run concurrently
+	@classmethod
+	def get_resource(cls):
+		return Scheduler.IO
+
+	# Rotate file
 	@classmethod
 	@trace
 	def execute(cls, file, batch):
-		command = Command.Command(batch._progresswindow.get_output_buffer())
-		generator = command.execute('/usr/bin/jhead', '-autorot', file.get_path())
+		command = Command.Command(batch._progresswindow, file.get_name())
+		generator = command.execute(Config.TOOLS['jhead'], '-autorot', file.get_path())
 		# TODO: Better use (supported from python 3.3): yield from ...
 		message = None
 		while True:
@@ -100,6 +167,104 @@ class Rotate(Action):
 			except StopIteration:
 				break
 
+	# Rotate all files of a directory by one jhead call
+	@classmethod
+	def get_batch_key(cls, file):
+		return os.path.dirname(file.get_path())
+
+	# Rotate files and map the result of jhead back to the files
+	@classmethod
+	@trace
+	def execute_batch(cls, files, batch):
+		command = Command.Command(batch._progresswindow, os.path.basename(cls.get_batch_key(files[0])), True)
+		generator = command.execute(Config.TOOLS['jhead'], '-autorot', *[file.get_path() for file in files])
+		failure = None
+		# TODO: Better use (supported from python 3.3): yield from ...
+		message = None
+		while True:
+			try:
+				item = generator.send(message)
+				message = yield item
+			except StopIteration:
+				break
+			except Exception as e:
+				failure = str(e)
+				break
+		errors = cls.get_jhead_errors(command.get_captured_output(), [file.get_path() for file in files])
+		for file in files:
+			yield
+			if file.get_path() in errors:
+				file.add_properties({File.ACTIONERROR: '; '.join(errors[file.get_path()])})
+				continue
+			# Verify orientation since jhead does not report every file
+			file.reload_tags()
+			if not cls.needs_rotation(file): continue
+			if failure is not None:
+				# jhead stops at a fatal error, rotate the files it did not get to one by one
+				error = None
+				# TODO: Better use (supported from python 3.3): yield from ...
+				generator = cls.execute(file, batch)
+				message = None
+				while True:
+					try:
+						item = generator.send(message)
+						message = yield item
+					except StopIteration:
+						break
+					except Exception as e:
+						error = str(e)
+						break
+				if error is not None:
+					file.add_properties({File.ACTIONERROR: error})
+					continue
+				file.reload_tags()
+				if not cls.needs_rotation(file): continue
+			file.add_properties({File.ACTIONERROR: 'Not rotated' + (' (%s)' % failure if failure else '')})
+
+	# Check whether orientation of file is not normal
+	@classmethod
+	def needs_rotation(cls, file):
+		orientation = file.get_orientation()
+		return orientation != None and orientation != 0 and orientation != 1
+
+	# Map errors in jhead output to the paths (path -> [error]); jhead quotes the path of the file exactly:
+	# "Nonfatal Error : '<path>' <message>" or "Error : <message>" followed by "in file '<path>'"
+	@classmethod
+	def get_jhead_errors(cls, output, paths):
+		errors = {}
+		error = None
+		for line in output.splitlines():
+			line = line.strip()
+			if line.startswith('Nonfatal Error : '):
+				for path in paths:
+					prefix = "Nonfatal Error : '%s' " % path
+					if line.startswith(prefix): errors.setdefault(path, []).append('Nonfatal Error : ' + line[len(prefix):])
+			elif line.startswith('Error : '):
+				error = line
+			elif line.startswith("in file '") and line.endswith("'"):
+				path = line[len("in file '"):-1]
+				if error is not None and path in paths: errors.setdefault(path, []).append(error)
+				error = None
+		return errors
+
+class SetOrientation(Action):
+	@classmethod
+	def get_text(self, file = None):
+		return "Keep orientation (metadata only)"
+
+	# Return whether action shall be postponed to postprocessing
+	@classmethod
+	def is_postprocessing(cls):
+		return True
+
+	# Keep pixels and write the orientation to all orientation tags (saved together with other metadata changes)
+	# Files whose tags already agree are not modified (and not saved)
+	@classmethod
+	@trace
+	def execute(cls, file, batch):
+		if not file.set_orientation(file.get_orientation()): logger.info('Orientation tags of %s already agree', file.get_path())
+		yield
+
 class ConvertGroup(Action):
 	@classmethod
 	def get_text(self, file = None):
@@ -110,6 +275,18 @@ class ConvertGroup(Action):
 	def is_postprocessing(cls):
 		return True
 
+	# Return resource class limiting how many of these actions run concurrently
+	@classmethod
+	def get_resource(cls):
+		return Scheduler.CPU
+
+	# Stitching time grows with the number of pixels and (matching control points) the number of frames
+	@classmethod
+	def estimate(cls, file):
+		group = file.get_property(File.GROUPCONVERT)
+		pixels = sum([f.get_pixel_count() for f in group])
+		return (pixels * len(group), pixels * Config.STITCH_BYTES_PER_PIXEL)
+
 	# Convert file group (panorama, HDR)
 	@classmethod
 	@trace
@@ -122,11 +299,11 @@ class ConvertGroup(Action):
 			paths.append(f.get_path())
 			for tag in tags:
 				if tag in f.get_tags(): tags[tag] += 1
-		command = Command.Command(batch._progresswindow.get_output_buffer())
+		command = batch.get_command(file.get_name())
 		if tags['Panorama'] == len(group) and tags['HDR'] == 0:
-			generator = command.execute('/usr/bin/postprocess-photo', '-p', '-o', file.get_path(), *paths)
+			generator = command.execute(Config.TOOLS['postprocess-photo'], '-p', '-o', file.get_path(), *paths)
 		elif tags['HDR'] == len(group) and tags['Panorama'] == 0:
-			generator = command.execute('/usr/bin/postprocess-photo', '-h', '-o', file.get_path(), *paths)
+			generator = command.execute(Config.TOOLS['postprocess-photo'], '-h', '-o', file.get_path(), *paths)
 		else: raise Exception('File group %s group has inconsistent tags' % file.get_group())
 		# Better use (supported from python 3.3): yield from ...
 		message = None
@@ -188,7 +365,7 @@ class SetCreationTime(Action):
 	def is_postprocessing(cls):
 		return True
 
-	# Set exif creation time
+	# Set exif creation time (saved together with other metadata changes)
 	@classmethod
 	@trace
 	def execute(cls, file, batch):
@@ -196,7 +373,9 @@ class SetCreationTime(Action):
 		for key, creation_time in creation_times.items():
 			file.set_creation_time(key, creation_time)
 			yield
-		if len(creation_times) > 0: file.save()
 
 from . import Command
+from . import Config
 from . import File
+from . import Scheduler
+from . import TrashCan
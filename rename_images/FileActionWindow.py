@@ -1,12 +1,13 @@
+import concurrent.futures
 import datetime
 import logging
 import sys
 import traceback
 
-from gi.repository import GObject, Gtk, GdkPixbuf, Gio
+from gi.repository import GObject, Gtk, GdkPixbuf, Gio, GLib
 
 from . import Batch, ProgressWindow
-from .Annotations import trace, yieldsleep
+from .Annotations import Event, PRIORITY_HIGH, trace, yieldsleep
 
 logger = logging.getLogger('FileActionWindow')
 
@@ -18,7 +19,13 @@ class FileActionWindow(Gtk.ApplicationWindow):
 		Gtk.ApplicationWindow.__init__(self, application=app)
 		self._update_counter = 0
 		self._parent = parent
+		self._properties = properties
 		self._rename = properties.get('command') == 'rename'
+		# Thumbnails of the preview are loaded for the visible rows only
+		self._thumbnail_executor = None
+		self._thumbnail_futures = {}
+		self._thumbnail_rows = set()
+		self._thumbnail_source = None
 		self.create_widgets()
 
 		# Prepare data loading
@@ -89,8 +96,11 @@ class FileActionWindow(Gtk.ApplicationWindow):
 		if self._rename:
 			# Create listview for preview
 			box.append(Gtk.Label(label='Preview', valign=Gtk.Align.FILL))
-			self._liststore_preview = Gtk.ListStore(File.File, str, str, str, str)
+			self._liststore_preview = Gtk.ListStore(*get_preview_columns())
 			self._treeview_preview = Gtk.TreeView(model=self._liststore_preview)
+			cellrenderer = Gtk.CellRendererPixbuf()
+			cellrenderer.set_fixed_size(Config.THUMBNAIL_SIZE, Config.THUMBNAIL_SIZE)
+			self._treeview_preview.append_column(Gtk.TreeViewColumn('', cellrenderer, pixbuf=5))
 			self._treeview_preview.append_column(Gtk.TreeViewColumn('Source', Gtk.CellRendererText(editable=False), text=1))
 			column = Gtk.TreeViewColumn('Destination')
 			cellrenderer = Gtk.CellRendererPixbuf()
@@ -102,11 +112,16 @@ class FileActionWindow(Gtk.ApplicationWindow):
 			self._treeview_preview.append_column(column)
 			self._treeview_preview.append_column(Gtk.TreeViewColumn('Date', Gtk.CellRendererText(editable=False), text=4))
 			self._scrolledtreeview_preview = Gtk.ScrolledWindow(min_content_height=200, min_content_width=700, child=self._treeview_preview, valign=Gtk.Align.FILL, vexpand=True)
+			self._scrolledtreeview_preview.get_vadjustment().connect('value-changed', self.schedule_thumbnails)
+			self._scrolledtreeview_preview.get_vadjustment().connect('changed', self.schedule_thumbnails)
 			box.append(self._scrolledtreeview_preview)
 		# Buttons
 		hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5, valign=Gtk.Align.FILL)
 		self._button_ok.connect('clicked', self.button_ok_clicked)
 		hbox.append(self._button_ok)
+		self._button_reload = Gtk.Button(label="Reload", halign=Gtk.Align.FILL)
+		self._button_reload.connect('clicked', self.button_reload_clicked)
+		hbox.append(self._button_reload)
 		self._button_cancel = Gtk.Button(label="Cancel", halign=Gtk.Align.FILL)
 		self._button_cancel.connect('clicked', self.button_cancel_clicked)
 		hbox.append(self._button_cancel)
@@ -147,9 +162,81 @@ class FileActionWindow(Gtk.ApplicationWindow):
 		if self._rename:
 			for group in sorted(self._batch._files_by_group):
 				for file in sorted(self._batch._files_by_group[group]._files):
-					self._liststore_preview.append([file, self._batch.get_relative_path(file), self._batch.get_relative_path(file), '', file.get_creation_time().strftime("%x %X")]) #"%Y-%m-%d %H:%M:%S"
+					self._liststore_preview.append(get_preview_row(self._batch, file))
 			self._entry_base.set_text(self._batch._base)
 			self._spinbutton_counter.set_value(self._batch._counter)
+			self.schedule_thumbnails()
+
+	# Load thumbnails once scrolling paused
+	def schedule_thumbnails(self, *args):
+		if self._thumbnail_source is None:
+			self._thumbnail_source = GLib.timeout_add(THUMBNAIL_DELAY, self.load_visible_thumbnails)
+
+	# Load thumbnails of the visible preview rows on worker threads
+	# Rows scrolled out of view release their thumbnails (the thumbnail cache keeps the recently used ones)
+	def load_visible_thumbnails(self):
+		self._thumbnail_source = None
+		visible, start, end = self._treeview_preview.get_visible_range()
+		if not visible: return False
+		rows = range(start.get_indices()[0], end.get_indices()[0] + 1)
+		for index in list(self._thumbnail_futures.keys()):
+			if index not in rows and self._thumbnail_futures[index].cancel(): del self._thumbnail_futures[index]
+		for index in list(self._thumbnail_rows):
+			if index in rows: continue
+			iter = self._liststore_preview.iter_nth_child(None, index)
+			if iter is not None: self._liststore_preview.set_value(iter, 5, None)
+			self._thumbnail_rows.discard(index)
+		for index in rows:
+			if index in self._thumbnail_rows or index in self._thumbnail_futures: continue
+			iter = self._liststore_preview.iter_nth_child(None, index)
+			if iter is None: break
+			file = self._liststore_preview.get_value(iter, 0)
+			thumbnail = file.get_cached_thumbnail(Config.THUMBNAIL_SIZE)
+			if thumbnail is not None:
+				self.set_thumbnail(index, file, thumbnail)
+				continue
+			if self._thumbnail_executor is None:
+				self._thumbnail_executor = concurrent.futures.ThreadPoolExecutor(max_workers = Config.THUMBNAIL_JOBS, thread_name_prefix = 'thumbnail')
+			future = self._thumbnail_executor.submit(file.load_thumbnail, Config.THUMBNAIL_SIZE)
+			# Display it from the main loop (widgets are not thread-safe)
+			future.add_done_callback(lambda future, index = index, file = file: GLib.idle_add(self.on_thumbnail_loaded, index, file, future))
+			self._thumbnail_futures[index] = future
+		return False
+
+	# Thumbnail was loaded by a worker thread (called from main loop)
+	def on_thumbnail_loaded(self, index, file, future):
+		# Ignore thumbnails requested before the preview was filled again
+		if self._thumbnail_futures.get(index, None) is not future: return False
+		del self._thumbnail_futures[index]
+		if future.cancelled(): return False
+		try:
+			thumbnail = future.result()
+		except Exception as e:
+			logger.info('Cannot load thumbnail of %s: %s', file.get_path(), e)
+			return False
+		if thumbnail is not None: self.set_thumbnail(index, file, thumbnail)
+		return False
+
+	# Show thumbnail in preview row if the row still shows file
+	def set_thumbnail(self, index, file, thumbnail):
+		iter = self._liststore_preview.iter_nth_child(None, index)
+		if iter is None or self._liststore_preview.get_value(iter, 0) is not file: return
+		self._liststore_preview.set_value(iter, 5, thumbnail)
+		self._thumbnail_rows.add(index)
+
+	# Stop thumbnail workers (running loads finish in the background)
+	def close_thumbnails(self):
+		if self._thumbnail_source is not None: GLib.source_remove(self._thumbnail_source)
+		self._thumbnail_source = None
+		self.reset_thumbnails()
+		if self._thumbnail_executor is not None: self._thumbnail_executor.shutdown(wait = False, cancel_futures = True)
+		self._thumbnail_executor = None
+
+	# Forget thumbnails of the preview rows and stop loading them
+	def reset_thumbnails(self):
+		for future in self._thumbnail_futures.values(): future.cancel()
+		self._thumbnail_futures = {}
+		self._thumbnail_rows = set()
 
 	# Button ok was clicked, execute batch actions
 	@trace
@@ -160,12 +247,15 @@ class FileActionWindow(Gtk.ApplicationWindow):
 			# Execute a batch command displaying a progress window
 			generator = self._batch.execute()
 			for item in generator:
+				# Wake up on pause/cancel even while waiting for running commands
+				if isinstance(item, Event): item = Event.any(item, self._progresswindow.get_interrupt_event())
 				yield item
 				if self._progresswindow.check_pause_cancel():
 					# Pause command and wait for next user action
 					logger.info('Sending pause to generators')
 					generator.send(True)
 					while self._progresswindow.check_pause_cancel(): yield 100
+			self.close_thumbnails()
 			self._progresswindow.destroy()
 			self.destroy()
 		except Exception:
@@ -174,10 +264,23 @@ class FileActionWindow(Gtk.ApplicationWindow):
 			self._progresswindow.output('\n%s\n\n' % exc_value)
 			self._progresswindow.set_finished()
 
+	# Button reload was clicked, scan files again (only changed files are checked again)
+	@trace
+	def button_reload_clicked(self, button):
+		logger.info('User clicked reload button')
+		self._treestore_fileactions.clear()
+		if self._rename:
+			self.reset_thumbnails()
+			self._liststore_preview.clear()
+		self._batch.init(self._properties, self._progresswindow)
+		self.load_data(button)
+
 	# Button cancel was clicked or window was closed otherwise
 	@trace
 	def button_cancel_clicked(self, button):
 		logger.info('User clicked cancel button/closed window')
+		self.close_thumbnails()
+		self._batch.close_profiler()
 		self._progresswindow.destroy()
 		self.destroy()
 
@@ -194,7 +297,7 @@ class FileActionWindow(Gtk.ApplicationWindow):
 
 	# Base was changed by entry - reflect it into batch
 	@trace
-	@yieldsleep
+	@yieldsleep(priority=PRIORITY_HIGH)
 	def action_base_changed(self, widget):
 		try:
 			self._batch._base = widget.get_text()
@@ -207,7 +310,7 @@ class FileActionWindow(Gtk.ApplicationWindow):
 
 	# Counter was changed by spinbutton - reflect it into batch
 	@trace
-	@yieldsleep
+	@yieldsleep(priority=PRIORITY_HIGH)
 	def action_counter_changed(self, widget):
 		try:
 			self._batch._counter = widget.get_value_as_int()
@@ -220,7 +323,7 @@ class FileActionWindow(Gtk.ApplicationWindow):
 
 	# Sorting was changed by combobox - reflect it into batch
 	@trace
-	@yieldsleep
+	@yieldsleep(priority=PRIORITY_HIGH)
 	def action_sorting_changed(self, widget):
 		try:
 			sorting = widget.get_active_text()
@@ -273,17 +376,7 @@ class FileActionWindow(Gtk.ApplicationWindow):
 		iter = self._liststore_preview.get_iter_first()
 		while iter:
 			file = self._liststore_preview.get_value(iter, 0)
-			if file.check_delete_action():
-				dest = '<File will be deleted>'
-				icon = 'edit-delete'
-			else:
-				dest = self._batch.get_relative_path(file.get_destination())
-				if file.get_property(File.RENAMEERROR) is not None:
-					icon = 'process-stop'
-				elif file.get_uri() == file.get_destination_uri():
-					icon = 'change-prevent'
-				else:
-					icon = ''
+			dest, icon = self._batch.get_preview(file)
 			self._liststore_preview.set_value(iter, 2, dest)
 			self._liststore_preview.set_value(iter, 3, icon)
 			iter = self._liststore_preview.iter_next(iter)
@@ -297,7 +390,19 @@ class FileActionWindow(Gtk.ApplicationWindow):
 		dialog.run()
 		dialog.destroy()
 
+# Milliseconds without scrolling before thumbnails of the visible rows are loaded
+THUMBNAIL_DELAY = 100
+
+# Get column types of the preview: file, source, destination, destination icon name, date, thumbnail
+def get_preview_columns():
+	return [File.File, str, str, str, str, GdkPixbuf.Pixbuf]
+
+# Get preview row of file; the thumbnail is loaded once the row is visible (see load_visible_thumbnails)
+def get_preview_row(batch, file):
+	return [file, batch.get_relative_path(file), batch.get_relative_path(file), '', file.get_creation_time().strftime("%x %X"), None] #"%Y-%m-%d %H:%M:%S"
+
 from . import Batch
+from . import Config
 from . import File
 from . import FileAction
 from . import FileCheck
@@ -1,13 +1,15 @@
 import collections
 import logging
-import sys
 import traceback
 
-from gi.repository import GObject, Gio
+from gi.repository import GObject
 from .Annotations import trace
 
 logger = logging.getLogger('FileCheck')
 
+# Maximum number of files passed to one execute_batch call (keeps command lines short)
+MAX_BATCH_FILES = 256
+
 class Check(GObject.GObject):
 	# List of all file checks
 	_checks = collections.OrderedDict()
@@ -52,30 +54,54 @@ class Check(GObject.GObject):
 	@classmethod
 	@trace
 	def execute_actions(cls, files, batch):
-		batch._progresswindow.set_step('Executing actions for %s check ...' % cls.__name__, len(files))
 		errors = 0
+		# Report result of each action as soon as it finished
+		def on_finished(job, exc_info):
+			nonlocal errors
+			batch._progresswindow.increase_step(job.name)
+			for file in job.files:
+				if file.get_property(File.ACTIONERROR) is None: continue
+				batch._progresswindow.output('%s: %s\n' % (file.get_path(), file.get_property(File.ACTIONERROR)))
+				errors = errors + 1
+			if exc_info is None: return
+			exc_type, exc_value, exc_traceback = exc_info
+			traceback.print_exception(exc_type, exc_value, exc_traceback)
+			if cls.is_exception_fatal(job.files[0].get_property(cls), exc_type, exc_value):
+				raise exc_type(exc_value).with_traceback(exc_traceback)
+			else:
+				batch._progresswindow.output('\n%s\n\n' % exc_value)
+				errors = errors + len(job.files)
+		scheduler = Scheduler.Scheduler(batch._limits, on_finished, batch._memory_budget)
+		batches = collections.OrderedDict()
+		count = 0
 		for root in files:
-			batch._progresswindow.increase_step(Gio.File.new_for_uri(root).get_path())
 			for file in files[root]:
-				try:
-					logger.info("%s: action %s for %s", cls.__name__, file.get_property(cls).__name__, file.get_path())
-					# TODO: Better use (supported from python 3.3): yield from ...
-					generator = file.get_property(cls).execute(file, batch)
-					message = None
-					while True:
-						try:
-							item = generator.send(message)
-							message = yield item
-						except StopIteration:
-							break
-				except Exception:
-					exc_type, exc_value, exc_traceback = sys.exc_info()
-					traceback.print_exception(exc_type, exc_value, exc_traceback)
-					if cls.is_exception_fatal(file.get_property(cls), exc_type, exc_value):
-						raise exc_type(exc_value).with_traceback(exc_traceback)
-					else:
-						batch._progresswindow.output('\n%s\n\n' % exc_value)
-						errors = errors + 1
+				action = file.get_property(cls)
+				logger.info("%s: action %s for %s", cls.__name__, action.__name__, file.get_path())
+				file.add_properties({File.ACTIONERROR: None})
+				key = action.get_batch_key(file)
+				# Collect files which can be handled by one call
+				if key is not None:
+					batches.setdefault((action, key), []).append(file)
+					continue
+				cost, memory = action.estimate(file)
+				scheduler.add(Scheduler.Job(action.execute, (file, batch), [file], action.get_resource(), file.get_path(), cost, memory))
+				count += 1
+		for (action, key), batch_files in batches.items():
+			for index in range(0, len(batch_files), MAX_BATCH_FILES):
+				chunk = batch_files[index:index + MAX_BATCH_FILES]
+				scheduler.add(Scheduler.Job(action.execute_batch, (chunk, batch), chunk, action.get_resource(), '%s (%d files)' % (key, len(chunk))))
+				count += 1
+		batch._progresswindow.set_step('Executing actions for %s check ...' % cls.__name__, count)
+		# TODO: Better use (supported from python 3.3): yield from ...
+		generator = scheduler.run()
+		message = None
+		while True:
+			try:
+				item = generator.send(message)
+				message = yield item
+			except StopIteration:
+				break
 		if errors:
 			raise Exception('errors', errors)
 
@@ -92,17 +118,18 @@ class Unselected(Check):
 	@classmethod
 	@trace
 	def do_check(cls, batch):
-		batch._progresswindow.set_step('Checking for unselected files ...', len(batch._files_by_root))
+		batch.set_check_step('Checking for unselected files ...', len(batch._files_by_root))
 		seen = set()
-		for root in batch._files_by_root.keys():
+		for root in batch.get_check_roots():
 			path = batch._files_by_root[root][0].get_parent()
-			batch._progresswindow.increase_step(path.get_path())
+			batch.increase_check_step(path.get_path())
 			yield
 			pathuri = path.get_uri()
 			if pathuri in seen: continue
 			seen.add(pathuri)
 			for child in path.enumerate_children():
 				yield
+				if not batch.is_check_root(child.get_root()): continue
 				child.set_default_properties(False)
 				if child.get_root() in batch._files_by_root and child.get_extension().lower() in File.EXTENSIONS:
 					if child in batch._files_by_root[child.get_root()]: continue
@@ -123,10 +150,10 @@ class OnlyRaw(Check):
 	@classmethod
 	@trace
 	def do_check(cls, batch):
-		batch._progresswindow.set_step('Checking for single raw files ...', batch._file_count)
-		for root in batch._files_by_root:
+		batch.set_check_step('Checking for single raw files ...', batch._file_count)
+		for root in batch.get_check_roots():
 			for file in batch._files_by_root[root]:
-				batch._progresswindow.increase_step(file.get_path())
+				batch.increase_check_step(file.get_path())
 				yield
 				if file.get_property(File.STEP) != File.RAW: continue
 				onlyraw = True
@@ -149,16 +176,16 @@ class Rotate(Check):
 
 	@classmethod
 	def get_possible_actions(cls):
-		return [FileAction.Rotate, FileAction.Ignore]
+		return [FileAction.Rotate, FileAction.SetOrientation, FileAction.Ignore]
 
 	# Check which files have to be rotated
 	@classmethod
 	@trace
 	def do_check(cls, batch):
-		batch._progresswindow.set_step('Checking for rotated files ...', 1)
-		for root in batch._files_by_root:
+		batch.set_check_step('Checking for rotated files ...', 1)
+		for root in batch.get_check_roots():
 			for file in batch._files_by_root[root]:
-				batch._progresswindow.increase_step(file.get_path())
+				batch.increase_check_step(file.get_path())
 				yield
 				if not file.get_property(File.TAGS): continue
 				orientation = file.get_orientation()
@@ -181,12 +208,12 @@ class NewFileGroup(Check):
 	@trace
 	def do_check(cls, batch):
 		if batch._command != 'postprocess': return
-		batch._progresswindow.set_step('Checking for new file groups ...', batch._file_count)
-		for group in batch._files_by_group:
+		batch.set_check_step('Checking for new file groups ...', batch._file_count)
+		for group in batch.get_check_groups():
 			result_file = False
 			group_files = []
 			for file in batch._files_by_group[group]._files:
-				batch._progresswindow.increase_step(file.get_path())
+				batch.increase_check_step(file.get_path())
 				yield
 				if file.get_index() == file.get_extension(): result_file = True
 				elif file.get_property(File.GROUPCONVERT): group_files.append(file)
@@ -211,10 +238,10 @@ class CreationTime(Check):
 	@classmethod
 	@trace
 	def do_check(cls, batch):
-		batch._progresswindow.set_step('Checking for creation time ...', 1)
-		for group in batch._files_by_group:
+		batch.set_check_step('Checking for creation time ...', 1)
+		for group in batch.get_check_groups():
 			for file in batch._files_by_group[group]._files:
-				batch._progresswindow.increase_step(file.get_path())
+				batch.increase_check_step(file.get_path())
 				yield
 				if not file.get_property(File.TAGS): continue
 				creation_times = {}
@@ -230,3 +257,4 @@ Check.register(CreationTime)
 
 from . import File
 from . import FileAction
+from . import Scheduler
@@ -0,0 +1,303 @@
+import datetime
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import time
+
+from gi.repository import GLib
+from .Annotations import run_until_complete, trace
+
+logger = logging.getLogger('JobQueue')
+
+# Numbering of jobs submitted by this process
+_job_counter = itertools.count(1)
+
+# Queue of external commands in a directory shared by several machines (e.g. the photo share)
+# new/<id>.json: submitted jobs; claimed/<id>.json: jobs being run (claimed by atomic rename, the mtime is the lease)
+# done/<id>.json: results; logs/<id>.log: command output (both removed when the result is collected)
+# done/<id>.abandoned: the submitter cancelled the job, whoever sees the marker last removes its files
+# clock: touched to read the time of the share, leases are measured with it (the clocks of the machines may differ)
+# Paths in jobs have to be valid on all machines (same mount point); tools are resolved by each worker (see Config.TOOLS)
+class JobQueue:
+	def __init__(self, directory, lease = None):
+		self._directory = directory
+		self._lease = lease if lease is not None else Config.QUEUE_LEASE
+		for name in ['new', 'claimed', 'done', 'logs']:
+			os.makedirs(os.path.join(directory, name), exist_ok = True)
+
+	# Display nicely on print
+	def __str__(self):
+		return self._directory
+
+	# Get path of a job file
+	def get_path(self, state, id):
+		return os.path.join(self._directory, state, id + ('.log' if state == 'logs' else '.json'))
+
+	# Get path of the marker of an abandoned job
+	def get_abandoned_path(self, id):
+		return os.path.join(self._directory, 'done', id + '.abandoned')
+
+	# Remove file if it exists
+	def remove(self, path):
+		try:
+			os.unlink(path)
+		except FileNotFoundError:
+			pass
+
+	# Write file atomically (readers never see partial files)
+	def write(self, path, data):
+		temp = '%s.%s-%d.tmp' % (path, socket.gethostname(), os.getpid())
+		with open(temp, 'w', encoding='utf-8') as f:
+			json.dump(data, f)
+		os.rename(temp, path)
+
+	# Read job or result; None if it does not exist (any more)
+	def read(self, path):
+		try:
+			with open(path, encoding='utf-8') as f:
+				return json.load(f)
+		except FileNotFoundError:
+			return None
+
+	# Submit command (tool name or path and its arguments); returns job id
+	def submit(self, tool, args, label):
+		id = '%s-%s-%d-%d' % (datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f'), socket.gethostname(), os.getpid(), next(_job_counter))
+		self.write(self.get_path('new', id), {'id': id, 'tool': tool, 'args': list(args), 'label': label, 'submitted': time.time()})
+		logger.info('Submitted job %s: %s %s', id, tool, ' '.join(args))
+		return id
+
+	# Withdraw job if no worker claimed it yet; returns False if it is already running or finished
+	def withdraw(self, id):
+		try:
+			os.unlink(self.get_path('new', id))
+			return True
+		except FileNotFoundError:
+			return False
+
+	# Claim the oldest submitted job; returns None if there is none
+	def claim(self, worker):
+		for name in sorted(os.listdir(os.path.join(self._directory, 'new'))):
+			if not name.endswith('.json'): continue
+			id = name[:-len('.json')]
+			claimed = self.get_path('claimed', id)
+			try:
+				# The lease starts now, not when the job was submitted (rename keeps the mtime)
+				os.utime(self.get_path('new', id))
+				os.rename(self.get_path('new', id), claimed)
+			except FileNotFoundError:
+				# Claimed by another worker in the meantime
+				continue
+			job = self.read(claimed)
+			if job is None: continue
+			if os.path.exists(self.get_abandoned_path(id)):
+				logger.info('Dropping abandoned job %s', id)
+				self.remove(claimed)
+				self.collect(id)
+				continue
+			job['worker'] = worker
+			job['claimed'] = time.time()
+			self.write(claimed, job)
+			return job
+		return None
+
+	# Check whether job is still claimed by worker (the claim is lost once the lease expired)
+	def is_claimed(self, job):
+		claim = self.read(self.get_path('claimed', job['id']))
+		return claim is not None and claim.get('worker', None) == job['worker']
+
+	# Extend lease of a claimed job; returns False if it was lost
+	def renew(self, job):
+		if not self.is_claimed(job): return False
+		try:
+			os.utime(self.get_path('claimed', job['id']))
+			return True
+		except FileNotFoundError:
+			return False
+
+	# Get current time of the file system holding the queue (mtimes of touched files are set by the file server)
+	def get_time(self):
+		path = os.path.join(self._directory, 'clock')
+		try:
+			os.utime(path)
+		except FileNotFoundError:
+			with open(path, 'a'): pass
+		return os.stat(path).st_mtime
+
+	# Submit jobs again whose lease expired (e.g. the worker crashed or its machine went down)
+	def requeue_expired(self):
+		now = self.get_time()
+		for name in os.listdir(os.path.join(self._directory, 'claimed')):
+			if not name.endswith('.json'): continue
+			path = os.path.join(self._directory, 'claimed', name)
+			try:
+				if now - os.stat(path).st_mtime < self._lease: continue
+				os.rename(path, os.path.join(self._directory, 'new', name))
+			except FileNotFoundError:
+				continue
+			logger.warn('Lease of job %s expired, submitting it again', name[:-len('.json')])
+
+	# Store result of a job claimed by this worker; returns False if the claim was lost (another worker runs it again)
+	def finish(self, job, returncode, error):
+		if not self.is_claimed(job): return False
+		self.write(self.get_path('done', job['id']), {'id': job['id'], 'worker': job['worker'], 'returncode': returncode, 'error': error, 'seconds': time.time() - job['claimed']})
+		self.remove(self.get_path('claimed', job['id']))
+		# Nobody collects the result of an abandoned job
+		if os.path.exists(self.get_abandoned_path(job['id'])): self.collect(job['id'])
+		return True
+
+	# Get result of job; None if it did not finish yet
+	def get_result(self, id):
+		return self.read(self.get_path('done', id))
+
+	# Remove result and log of job from the queue
+	def collect(self, id):
+		self.remove(self.get_path('done', id))
+		self.remove(self.get_path('logs', id))
+		self.remove(self.get_abandoned_path(id))
+
+	# Give up waiting for job: withdraw it or leave its cleanup to the worker running it
+	def abandon(self, id):
+		if self.withdraw(id): return
+		with open(self.get_abandoned_path(id), 'w'): pass
+		# The job may have finished before the marker existed
+		if os.path.exists(self.get_path('done', id)): self.collect(id)
+
+# Stand-in for Command running the command on a queue worker; waits for the result and displays the output written so far
+class RemoteCommand:
+	# output, label: see Command
+	def __init__(self, queue, output = None, label = None):
+		self._queue = queue
+		self._output = output
+		self._label = label
+		self._offset = 0
+
+	# Display output of the job written since the last call
+	def read_log(self, id):
+		try:
+			with open(self._queue.get_path('logs', id), 'rb') as f:
+				f.seek(self._offset)
+				data = f.read()
+		except FileNotFoundError:
+			return
+		# Only complete lines, the worker may be writing a multibyte character
+		end = data.rfind(b'\n') + 1
+		if end == 0 or self._output is None: return
+		self._offset += end
+		text = data[:end].decode('utf-8', 'replace')
+		if self._label is not None: text = ''.join(['[%s] %s\n' % (self._label, line) for line in text.split('\n')[:-1]])
+		self._output.output(text)
+
+	@trace
+	def execute(self, *args):
+		# Workers resolve the tool by name since it may be installed elsewhere on their machine
+		tool = args[0]
+		for name, path in Config.TOOLS.items():
+			if path == tool: tool = name
+		id = self._queue.submit(tool, args[1:], self._label)
+		if self._output is not None: self._output.output('# Job %s in %s\n' % (id, self._queue))
+		result = None
+		try:
+			while True:
+				result = self._queue.get_result(id)
+				self.read_log(id)
+				if result is not None:
+					self._queue.collect(id)
+					break
+				self._queue.requeue_expired()
+				# Remote processes cannot be paused, only waiting is
+				yield Config.QUEUE_POLL
+		finally:
+			if result is None:
+				logger.info('Abandoning job %s', id)
+				self._queue.abandon(id)
+		logger.info('Job %s finished on %s in %.1fs', id, result['worker'], result['seconds'])
+		if result['error'] is not None: raise Exception('job %s failed on %s: %s' % (id, result['worker'], result['error']))
+		if result['returncode'] != 0: raise Exception('command terminated with return code %d on %s' % (result['returncode'], result['worker']))
+
+# Output of a command run by a worker, written to the job's log in the queue
+class JobLog:
+	def __init__(self, path):
+		self._file = open(path, 'a', encoding='utf-8')
+
+	def output(self, text):
+		self._file.write(text)
+		self._file.flush()
+
+	def close(self):
+		self._file.close()
+
+# Worker running queued jobs one at a time (run several workers for parallelism)
+class Worker:
+	def __init__(self, queue):
+		self._queue = queue
+		self._name = '%s-%d' % (socket.gethostname(), os.getpid())
+		self._job = None
+		self._command = None
+
+	# Keep lease of the running job, stop the job if it was lost (called from main loop)
+	def on_renew(self):
+		if self._queue.renew(self._job): return True
+		logger.warn('Lost lease of job %s, stopping it', self._job['id'])
+		process = getattr(self._command, '_process', None)
+		if process is not None and process.returncode is None: os.killpg(process.pid, signal.SIGTERM)
+		return False
+
+	# Run job, storing its output and result in the queue
+	@trace
+	def run_job(self, job):
+		tool = Config.TOOLS.get(job['tool'], job['tool'])
+		logger.info('Running job %s: %s %s', job['id'], tool, ' '.join(job['args']))
+		log = JobLog(self._queue.get_path('logs', job['id']))
+		command = Command.Command(log, None)
+		returncode = 0
+		error = None
+		self._job = job
+		self._command = command
+		source = GLib.timeout_add(int(self._queue._lease * 1000 / 3), self.on_renew)
+		try:
+			# TODO: Better use (supported from python 3.3): yield from ...
+			generator = command.execute(tool, *job['args'])
+			message = None
+			while True:
+				try:
+					item = generator.send(message)
+					message = yield item
+				except StopIteration:
+					break
+		except Exception as e:
+			returncode = getattr(getattr(command, '_process', None), 'returncode', None)
+			error = str(e) if returncode is None else None
+		finally:
+			GLib.source_remove(source)
+			self._job = None
+			self._command = None
+			log.close()
+		if self._queue.finish(job, returncode, error): logger.info('Finished job %s (return code %s)', job['id'], returncode)
+		else: logger.warn('Discarding result of job %s, its claim was lost', job['id'])
+
+	# Run jobs until interrupted
+	@trace
+	def run(self):
+		while True:
+			self._queue.requeue_expired()
+			job = self._queue.claim(self._name)
+			if job is None:
+				yield Config.QUEUE_POLL
+				continue
+			for item in self.run_job(job): yield item
+
+# Run a worker for the queue in directory until interrupted
+def work(directory):
+	queue = JobQueue(directory)
+	logger.info('Worker %s-%d waiting for jobs in %s', socket.gethostname(), os.getpid(), queue)
+	try:
+		run_until_complete(Worker(queue).run())
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+from . import Command
+from . import Config
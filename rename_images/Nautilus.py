@@ -41,6 +41,9 @@ class RenameImagesMenuProvider(Nautilus.MenuProvider, GObject.GObject):
 	def menu_activate_cb(self, menu, window, properties, uris):
 		if self._disabled: return
 		self._logger.info('User activated menu with properties %s for files [%s]', properties, ",".join(map(str, uris)))
+		if Service.submit(properties, uris):
+			self._logger.info('Submitted batch to service')
+			return
 		FileActionWindow.FileActionWindow(self._app, window, properties, uris).present()
 
 	# Show error dialog
@@ -104,3 +107,4 @@ class RenameImagesMenuProvider(Nautilus.MenuProvider, GObject.GObject):
 from . import File
 from . import FileActionWindow
 from . import Mode
+from . import Service
@@ -0,0 +1,72 @@
+import collections
+import concurrent.futures
+import logging
+import os
+
+from gi.repository import GLib
+from .Annotations import Event
+
+logger = logging.getLogger('Pipeline')
+
+# Streaming prepare: tags are read on worker threads as soon as the scanner found a file, directories are handed out
+# for checking once they were scanned completely and all their tags were read
+# Roots and groups never span directories, so the checks of a complete directory do not depend on files found later
+class Pipeline:
+	def __init__(self, jobs):
+		self._executor = concurrent.futures.ThreadPoolExecutor(max_workers = jobs, thread_name_prefix = 'tags')
+		# directory uri -> [(file, future)] in scan order
+		self._directories = collections.OrderedDict()
+		self._scanned = collections.deque()
+		self._event = Event()
+
+	# Read tags of file in the background
+	def add_file(self, file):
+		future = self._executor.submit(file.init)
+		future.add_done_callback(self.on_done)
+		self._directories.setdefault(os.path.dirname(file.get_uri()), []).append((file, future))
+
+	# Wake up the main loop when a tag read finished (events are not thread-safe)
+	def on_done(self, future):
+		GLib.idle_add(self.wake)
+
+	def wake(self):
+		self._event.set()
+		return False
+
+	# Mark directory as scanned completely (no more files of it will be added)
+	def set_scanned(self, uri):
+		if uri in self._directories: self._scanned.append(uri)
+
+	# Mark all remaining directories as scanned (end of scan, e.g. directories of single selected files)
+	def set_all_scanned(self):
+		queued = set(self._scanned)
+		self._scanned.extend([uri for uri in self._directories if uri not in queued])
+
+	# Get number of files in scanned directories which were not handed out yet
+	def get_pending_count(self):
+		return sum([len(self._directories[uri]) for uri in self._scanned])
+
+	# Check whether scanned directories are left
+	def has_scanned(self):
+		return len(self._scanned) > 0
+
+	# Get files of the next scanned directory (in scan order) if all its tags were read, None otherwise
+	# Exceptions of tag reads are raised here (like reading tags in the main loop would)
+	def get_ready(self):
+		if len(self._scanned) == 0: return None
+		files = self._directories[self._scanned[0]]
+		if not all([future.done() for file, future in files]): return None
+		del self._directories[self._scanned.popleft()]
+		for file, future in files: future.result()
+		return [file for file, future in files]
+
+	# Get event set by the next finished tag read; check get_ready() again after getting it
+	def get_event(self):
+		if self._event.is_set(): self._event = Event()
+		return self._event
+
+	# Stop reading tags (waits for running reads)
+	def close(self):
+		for files in self._directories.values():
+			for file, future in files: future.cancel()
+		self._executor.shutdown(wait = True)
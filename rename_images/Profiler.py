@@ -0,0 +1,61 @@
+import cProfile
+import logging
+import os
+import tracemalloc
+
+from . import Config
+
+logger = logging.getLogger('Profiler')
+
+# Profile a batch run with cProfile and tracemalloc; results are written to the profiles directory
+# Inspect results with e.g. python -m pstats <run id>.pstats or tracemalloc.Snapshot.load(<file>).statistics('lineno')
+class Profiler:
+	def __init__(self, run_id):
+		self._run_id = run_id
+		self._directory = Config.get_data_dir('profiles')
+		self._profile = cProfile.Profile()
+		self._snapshots = 0
+		self._last_phase = None
+		self._tracing = False
+
+	# Get path of a result file
+	def get_path(self, suffix):
+		return os.path.join(self._directory, '%s%s' % (self._run_id, suffix))
+
+	# Start or resume profiling
+	def start(self):
+		if not tracemalloc.is_tracing():
+			tracemalloc.start(Config.PROFILE_FRAMES)
+			self._tracing = True
+		self._profile.enable()
+
+	# Pause profiling and write the statistics collected so far
+	def stop(self):
+		self._profile.disable()
+		path = self.get_path('.pstats')
+		try:
+			self._profile.dump_stats(path)
+			logger.info('Wrote profile to %s', path)
+		except OSError as e:
+			logger.warn('Could not write profile %s: %s', path, e)
+
+	# Stop profiling and memory tracing
+	def close(self):
+		self.stop()
+		if self._tracing:
+			tracemalloc.stop()
+			self._tracing = False
+
+	# Write memory snapshot after a phase; repeated entries of the same phase (e.g. one per directory) share one snapshot
+	def snapshot(self, phase):
+		if not tracemalloc.is_tracing() or phase == self._last_phase: return
+		self._last_phase = phase
+		self._snapshots += 1
+		path = self.get_path('-%02d-%s.snapshot' % (self._snapshots, phase.replace(':', '-')))
+		try:
+			tracemalloc.take_snapshot().dump(path)
+		except OSError as e:
+			logger.warn('Could not write memory snapshot %s: %s', path, e)
+			return
+		current, peak = tracemalloc.get_traced_memory()
+		logger.info('Memory after %s: %.1f MiB (peak %.1f MiB), snapshot %s', phase, current / 1048576.0, peak / 1048576.0, path)
@@ -1,12 +1,19 @@
 import logging
 import sys
+import time
 import traceback
 
-from gi.repository import GObject, Gtk, GdkPixbuf, Gio
-from .Annotations import trace
+from gi.repository import GObject, Gtk, GdkPixbuf, Gio, GLib
+from .Annotations import Event, trace
+from . import Config
 
 logger = logging.getLogger('ProgressWindow')
 
+# Interval for grouping output appends in milliseconds
+OUTPUT_INTERVAL = 100
+# Maximum number of progress bar updates per second
+PROGRESS_FPS = 20
+
 # Dialog for displaying processing progress
 class ProgressWindow(Gtk.Window):
 	@trace
@@ -16,6 +23,12 @@ class ProgressWindow(Gtk.Window):
 		self._cancel = False
 		self._pause = False
 		self._is_paused = False
+		self._interrupt = Event()
+		self._pending_output = []
+		self._output_source = None
+		self._progress_text = None
+		self._progress_source = None
+		self._phase = None
 		self._parent = parent
 		Gtk.Window.__init__(self)
 		self.set_modal(True)
@@ -61,34 +74,86 @@ class ProgressWindow(Gtk.Window):
 	# Set progress text and progress bar
 	def set_step(self, text, count=1, progress_text=None):
 		#self.check_cancel()
+		self.finish_phase()
+		self._phase = {'name': text, 'updates': 0, 'refreshes': 0, 'time': 0.0}
 		self._count = count if count > 0 else 1
 		self._index = 0
+		self._progress_text = progress_text
 		self._label_step.set_text(text)
-		self._progressbar.set_fraction(float(self._index) / self._count)
-		self._progressbar.set_show_text(progress_text != None)
-		if progress_text: self._progressbar.set_text(progress_text)
+		self.refresh_progress()
 
-	# Step progress bar
+	# Step progress bar; widgets are updated at most PROGRESS_FPS times per second
 	def increase_step(self, progress_text=None):
 		#self.check_cancel()
 		self._index = self._index + 1
+		self._progress_text = progress_text
+		self.schedule_progress()
+
+	# Schedule update of progress bar
+	def schedule_progress(self):
+		if self._phase is not None: self._phase['updates'] += 1
+		if self._progress_source is None:
+			self._progress_source = GLib.timeout_add(1000 // PROGRESS_FPS, self.on_progress_timeout)
+
+	# Scheduled update of progress bar is due
+	def on_progress_timeout(self):
+		self._progress_source = None
+		self.refresh_progress()
+		return False
+
+	# Show recorded progress in progress bar
+	def refresh_progress(self):
+		if self._progress_source is not None:
+			GLib.source_remove(self._progress_source)
+			self._progress_source = None
+		start = time.perf_counter()
 		self._progressbar.set_fraction(float(self._index) / self._count)
-		self._progressbar.set_show_text(progress_text != None)
-		if progress_text: self._progressbar.set_text(progress_text)
+		self._progressbar.set_show_text(self._progress_text != None)
+		if self._progress_text: self._progressbar.set_text(self._progress_text)
+		if self._phase is not None:
+			self._phase['refreshes'] += 1
+			self._phase['time'] += time.perf_counter() - start
+
+	# Log how many widget updates the rate limit saved in the current phase
+	def finish_phase(self):
+		if self._progress_source is not None: self.refresh_progress()
+		if self._phase is None: return
+		phase, self._phase = self._phase, None
+		saved = (phase['updates'] - phase['refreshes']) * phase['time'] / max(phase['refreshes'], 1)
+		logger.debug('%s: %d progress updates, %d widget refreshes (%.3fs), saved about %.3fs', phase['name'], phase['updates'], phase['refreshes'], phase['time'], saved)
+
+	# Hiding the window ends the current phase
+	def set_visible(self, visible):
+		if not visible: self.finish_phase()
+		Gtk.Window.set_visible(self, visible)
 
 	# Get buffer of output textview
 	def get_output_buffer(self):
 		return self._textview_output.get_buffer()
 
-	# Append text to output textview
+	# Append text to output textview; appends are grouped to keep repaints cheap
 	def output(self, text):
-		self.get_output_buffer().insert(self.get_output_buffer().get_end_iter(), text)
+		self._pending_output.append(text)
+		if self._output_source is None:
+			self._output_source = GLib.timeout_add(OUTPUT_INTERVAL, self.flush_output)
+
+	# Insert pending output and drop the oldest lines exceeding the limit
+	def flush_output(self):
+		self._output_source = None
+		if len(self._pending_output) == 0: return False
+		text, self._pending_output = ''.join(self._pending_output), []
+		buffer = self.get_output_buffer()
+		buffer.insert(buffer.get_end_iter(), text)
+		excess = buffer.get_line_count() - Config.OUTPUT_LINES
+		if excess > 0:
+			buffer.delete(buffer.get_start_iter(), buffer.get_iter_at_line(excess)[1])
+		return False
 
 	# Increase number of total steps
 	def increase_count(self, count):
 		#self.check_cancel()
 		self._count = self._count + count
-		self._progressbar.set_fraction(float(self._index) / self._count)
+		self.schedule_progress()
 
 	# Operation was finished, so hide pause and replace cancel by close
 	def set_finished(self):
@@ -99,11 +164,21 @@ class ProgressWindow(Gtk.Window):
 		self.disconnect(self._window_close_handler)
 		self._window_close_handler = self.connect('close-request', self.button_close_clicked)
 
+	# Get event which is set when the user pauses or cancels (to wake up waiting generators)
+	def get_interrupt_event(self):
+		return self._interrupt
+
+	# Wake up generators waiting for the interrupt event
+	def interrupt(self):
+		event, self._interrupt = self._interrupt, Event()
+		event.set()
+
 	# Cancel button action
 	@trace
 	def button_cancel_clicked(self, widget):
 		logger.info('User clicked cancel button / closed window')
 		self._cancel = True
+		self.interrupt()
 
 	# Close button action
 	def button_close_clicked(self, widget):
@@ -116,6 +191,7 @@ class ProgressWindow(Gtk.Window):
 	def button_pause_clicked(self, widget):
 		logger.info('User clicked %s button' % ('resume' if self._is_paused else 'pause'))
 		self._pause = not self._is_paused
+		self.interrupt()
 
 	# Determine whether cancel button was clicked meanwhile
 	#@trace
@@ -0,0 +1,107 @@
+import array
+import collections
+import json
+import logging
+import os
+import time
+
+from . import Config
+
+logger = logging.getLogger('Report')
+
+# Timing of one phase of a batch run; a phase may be entered several times (e.g. scanning several directories)
+class Phase:
+	def __init__(self, name):
+		self.name = name
+		self.wall = 0.0
+		self.latencies = array.array('d')
+		self._start = None
+
+	# Enter phase
+	def start(self):
+		self._start = time.perf_counter()
+
+	# Leave phase
+	def stop(self):
+		if self._start is None: return
+		self.wall += time.perf_counter() - self._start
+		self._start = None
+
+	# Get percentile (0..100) of step latencies (nearest rank)
+	def percentile(self, latencies, percent):
+		if len(latencies) == 0: return 0.0
+		index = max(0, min(len(latencies) - 1, int(round(percent / 100.0 * len(latencies))) - 1))
+		return latencies[index]
+
+	# Summarize phase for the report
+	def summarize(self):
+		latencies = sorted(self.latencies)
+		busy = sum(latencies)
+		return collections.OrderedDict([
+			('name', self.name),
+			('steps', len(latencies)),
+			('wall_seconds', self.wall),
+			('busy_seconds', busy),
+			('steps_per_second', len(latencies) / self.wall if self.wall > 0 else None),
+			('latency_ms', collections.OrderedDict([(name, self.percentile(latencies, percent) * 1000) for name, percent in [('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)]])),
+		])
+
+# Per-phase timing of a batch run, written as JSON summary next to the command logs
+class Report:
+	# on_phase_finished(name) is called whenever a phase is left (e.g. to take a memory snapshot)
+	def __init__(self, run_id, properties, on_phase_finished = None):
+		self._run_id = run_id
+		self._on_phase_finished = on_phase_finished
+		self._properties = properties
+		self._phases = collections.OrderedDict()
+		self._start = time.perf_counter()
+		self._counts = {}
+
+	# Get phase by name, creating it on first use
+	def get_phase(self, name):
+		if name not in self._phases: self._phases[name] = Phase(name)
+		return self._phases[name]
+
+	# Record a count (e.g. number of files) for the summary
+	def set_count(self, name, value):
+		self._counts[name] = value
+
+	# Run generator as (part of) a phase, timing each step; messages are passed through
+	def measure(self, name, generator):
+		phase = self.get_phase(name)
+		phase.start()
+		try:
+			message = None
+			while True:
+				start = time.perf_counter()
+				try:
+					item = generator.send(message)
+				except StopIteration:
+					break
+				# Only completed steps count as latency samples; the remainder shows up in the wall time
+				phase.latencies.append(time.perf_counter() - start)
+				message = yield item
+		finally:
+			phase.stop()
+			if self._on_phase_finished is not None: self._on_phase_finished(name)
+
+	# Write JSON summary, removing the oldest reports; returns its path
+	def write(self):
+		summary = collections.OrderedDict([
+			('run_id', self._run_id),
+			('command', self._properties.get('command', None)),
+			('properties', self._properties),
+			('counts', self._counts),
+			('total_seconds', time.perf_counter() - self._start),
+			('phases', [phase.summarize() for phase in self._phases.values()]),
+		])
+		path = os.path.join(Config.get_data_dir('reports'), '%s.json' % self._run_id)
+		try:
+			with open(path, 'w') as f:
+				json.dump(summary, f, indent=1, default=str)
+		except OSError as e:
+			logger.warn('Could not write report %s: %s', path, e)
+			return None
+		logger.info('Wrote performance report to %s', path)
+		Config.prune_data_dir('reports', Config.KEEP_REPORTS)
+		return path
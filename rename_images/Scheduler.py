@@ -0,0 +1,195 @@
+import collections
+import heapq
+import itertools
+import logging
+import os
+import sys
+
+from gi.repository import GObject
+from .Annotations import Event, trace
+from . import Config
+
+logger = logging.getLogger('Scheduler')
+
+# Resource classes of jobs
+CPU = 'cpu'
+IO = 'io'
+INLINE = 'inline'
+# Tag reads of a pipelined prepare and metadata writes (not scheduled as jobs, but limited the same way)
+READ = 'read'
+WRITE = 'write'
+
+# Number of pending jobs considered when the longest jobs do not fit into memory
+MAX_BACKFILL = 32
+
+# Default number of concurrently running jobs per resource class
+def get_default_limits():
+	return {CPU: os.cpu_count() or 1, IO: 2, INLINE: 1, READ: Config.READ_JOBS, WRITE: Config.WRITE_JOBS}
+
+# Read /proc/meminfo (values in bytes)
+def read_meminfo():
+	meminfo = {}
+	try:
+		with open('/proc/meminfo') as f:
+			for line in f:
+				key, value = line.split(':', 1)
+				value = value.split()
+				meminfo[key] = int(value[0]) * (1024 if len(value) > 1 and value[1] == 'kB' else 1)
+	except (OSError, ValueError) as e:
+		logger.warn('Could not read /proc/meminfo: %s', e)
+	return meminfo
+
+# Get memory available for new processes in bytes (None if unknown)
+def get_available_memory():
+	return read_meminfo().get('MemAvailable', None)
+
+# Get share of time (in percent) some tasks stalled on memory during the last 10s (None if unsupported)
+def get_memory_pressure():
+	try:
+		with open('/proc/pressure/memory') as f:
+			for line in f:
+				fields = line.split()
+				if fields[0] != 'some': continue
+				for field in fields[1:]:
+					key, value = field.split('=', 1)
+					if key == 'avg10': return float(value)
+	except (OSError, ValueError):
+		pass
+	return None
+
+# Default memory budget for concurrently running jobs in bytes
+def get_default_memory_budget():
+	if Config.MEMORY_BUDGET > 0: return Config.MEMORY_BUDGET * 1024 * 1024
+	available = get_available_memory()
+	if available is None: return None
+	return int(available * 0.8)
+
+# Job executing a generator function (e.g. a file action) within the scheduler
+# cost: estimated run time (relative); memory: estimated peak memory in bytes
+class Job:
+	def __init__(self, function, args, files, resource = INLINE, name = None, cost = 0, memory = 0):
+		self._function = function
+		self._args = args
+		self._generator = None
+		self._started = False
+		self.wait = None
+		self.files = files
+		self.resource = resource
+		self.name = name
+		self.cost = cost
+		self.memory = memory
+
+	# Display nicely on print
+	def __str__(self):
+		return self.name or str(self._function)
+
+	# Create the generator of the job
+	def start(self):
+		self._generator = self._function(*self._args)
+
+	# Run job up to its next yield
+	def step(self, message):
+		if not self._started:
+			self._started = True
+			self.wait = next(self._generator)
+		else:
+			self.wait = self._generator.send(message)
+		return self.wait
+
+	# Abort job
+	def close(self):
+		if self._generator is not None: self._generator.close()
+
+# Class running jobs concurrently while limiting the number of running jobs per resource class
+# Jobs are started longest (highest cost) first; jobs with a memory estimate have to fit into the memory budget
+class Scheduler(GObject.GObject):
+	# on_finished(job, exc_info) is called for each finished job; exc_info is None on success
+	def __init__(self, limits, on_finished, memory_budget = None):
+		GObject.GObject.__init__(self)
+		self._limits = limits
+		self._on_finished = on_finished
+		self._memory_budget = memory_budget
+		self._pending = collections.defaultdict(list)
+		self._sequence = itertools.count()
+		self._running = []
+
+	# Add job to queue
+	def add(self, job):
+		heapq.heappush(self._pending[job.resource], (-job.cost, next(self._sequence), job))
+
+	# Check whether jobs are waiting to be started
+	def has_pending(self):
+		return any(len(queue) > 0 for queue in self._pending.values())
+
+	# Get number of running jobs per resource class
+	def get_running_counts(self):
+		counts = collections.Counter()
+		for job in self._running: counts[job.resource] += 1
+		return counts
+
+	# Check whether a job fits into the memory budget and the system is not under memory pressure
+	def fits_memory(self, job):
+		if job.memory <= 0: return True
+		used = sum([running.memory for running in self._running])
+		# Always allow one job, even if it exceeds the budget on its own
+		if used == 0: return True
+		if self._memory_budget is not None and used + job.memory > self._memory_budget: return False
+		available = get_available_memory()
+		if available is not None and job.memory > available: return False
+		pressure = get_memory_pressure()
+		if pressure is not None and pressure > Config.MEMORY_PRESSURE_LIMIT:
+			logger.info('Memory pressure %.1f%% too high, postponing %s', pressure, job)
+			return False
+		return True
+
+	# Start pending jobs as long as the limits of their resource class allow it
+	@trace
+	def start_jobs(self):
+		counts = self.get_running_counts()
+		for resource, queue in self._pending.items():
+			postponed = []
+			# Look at the longest jobs first; smaller jobs may fill up the memory budget
+			while len(queue) > 0 and len(postponed) < MAX_BACKFILL and counts[resource] < max(self._limits.get(resource, 1), 1):
+				item = heapq.heappop(queue)
+				job = item[2]
+				if not self.fits_memory(job):
+					postponed.append(item)
+					continue
+				logger.debug('Starting job %s (%s, cost %d, memory %d)', job, resource, job.cost, job.memory)
+				job.start()
+				self._running.append(job)
+				counts[resource] += 1
+			for item in postponed: heapq.heappush(queue, item)
+
+	# Execute all jobs; messages (e.g. pause) are passed to all running jobs
+	@trace
+	def run(self):
+		message = last_message = None
+		try:
+			while self.has_pending() or len(self._running) > 0:
+				# Do not start further jobs while paused
+				if not message: self.start_jobs()
+				waits = []
+				for job in list(self._running):
+					# Jobs waiting for an event only need to run if it occurred or the message (pause/resume) changed
+					if message == last_message and isinstance(job.wait, Event) and not job.wait.is_set():
+						waits.append(job.wait)
+						continue
+					try:
+						waits.append(job.step(message))
+					except StopIteration:
+						self.finish(job, None)
+					except Exception:
+						self.finish(job, sys.exc_info())
+				last_message = message
+				# Sleep only as long as all running jobs are sleeping
+				if len(waits) == 0 or None in waits: wait = None
+				else: wait = Event.any(*[wait if isinstance(wait, Event) else Event.timeout(wait) for wait in waits])
+				message = yield wait
+		finally:
+			for job in self._running: job.close()
+
+	# Remove finished job and report its result
+	def finish(self, job, exc_info):
+		self._running.remove(job)
+		self._on_finished(job, exc_info)
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import socket
+
+from . import Config
+
+logger = logging.getLogger('Service')
+
+# Convert command line paths to absolute paths since the service has its own working directory
+def absolute_uri(uri):
+	if '://' in uri: return uri
+	return os.path.abspath(uri)
+
+# Submit a batch to the resident service; returns False if no service is listening
+def submit(properties, uris):
+	request = json.dumps({'properties': properties, 'uris': [absolute_uri(uri) for uri in uris]})
+	try:
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			sock.connect(Config.SOCKET_PATH)
+			sock.sendall(request.encode('utf-8') + b'\n')
+			reply = sock.makefile('r', encoding='utf-8').readline()
+	except (FileNotFoundError, ConnectionRefusedError):
+		return False
+	except OSError as e:
+		logger.warn('Could not submit batch to service at %s: %s', Config.SOCKET_PATH, e)
+		return False
+	if not reply: return False
+	reply = json.loads(reply)
+	if reply.get('status') == 'ok': return True
+	logger.warn('Service rejected batch: %s', reply.get('error', None))
+	return False
+
+# Check structure of a request received by the service; raises ValueError if it is invalid
+def validate_request(request):
+	if not isinstance(request, dict): raise ValueError('request is not an object')
+	if not isinstance(request.get('properties', None), dict): raise ValueError('properties are not an object')
+	uris = request.get('uris', None)
+	if not isinstance(uris, list) or len(uris) == 0: raise ValueError('uris are not a non-empty list')
+	if not all([isinstance(uri, str) for uri in uris]): raise ValueError('uris are not strings')
+
+# Check whether a service is listening on the socket; remove stale sockets
+def is_running():
+	if not os.path.exists(Config.SOCKET_PATH): return False
+	try:
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			sock.connect(Config.SOCKET_PATH)
+		return True
+	except ConnectionRefusedError:
+		logger.info('Removing stale socket %s', Config.SOCKET_PATH)
+		os.unlink(Config.SOCKET_PATH)
+		return False
+
+# Run the resident service: keep the application with its caches alive and open a window for each submitted batch
+def serve():
+	if is_running():
+		logger.error('Service is already running on %s', Config.SOCKET_PATH)
+		return 1
+	# Import GUI lazily so clients which only submit batches start quickly
+	import gi
+	gi.require_version('Gtk', '4.0')
+	from gi.repository import Gio, Gtk
+	from . import File, FileActionWindow
+
+	# Only the service lives long enough for batches to share parsed metadata and listings
+	File.METADATA_CACHE.set_max_entries(Config.METADATA_CACHE_SIZE)
+	File.DIRECTORY_CACHE.set_max_entries(Config.DIRECTORY_CACHE_SIZE)
+	app = Gtk.Application(application_id = 'de.ritscher.rename_images.service', flags = Gio.ApplicationFlags.NON_UNIQUE)
+
+	# Read one request per connection and open a window for it; the client learns whether the request was accepted
+	def on_incoming(service, connection, source):
+		try:
+			stream = Gio.DataInputStream.new(connection.get_input_stream())
+			line, length = stream.read_line_utf8(None)
+			request = json.loads(line or '')
+			validate_request(request)
+			reply = {'status': 'ok'}
+		except Exception as e:
+			logger.error('Invalid request: %s', e)
+			request = None
+			reply = {'status': 'error', 'error': str(e)}
+		try:
+			connection.get_output_stream().write_all(json.dumps(reply).encode('utf-8') + b'\n', None)
+			connection.close(None)
+		except Exception as e:
+			logger.error('Could not reply to request: %s', e)
+		if request is None: return True
+		logger.info('Received batch with properties %s for files [%s]', request['properties'], ",".join(request['uris']))
+		File.METADATA_CACHE.log_statistics()
+		File.DIRECTORY_CACHE.log_statistics()
+		FileActionWindow.FileActionWindow(app, None, request['properties'], request['uris']).present()
+		return True
+
+	# Start listening once the application is registered
+	def on_activate(app):
+		app.hold()
+		listener = Gio.SocketService.new()
+		listener.add_address(Gio.UnixSocketAddress.new(Config.SOCKET_PATH), Gio.SocketType.STREAM, Gio.SocketProtocol.DEFAULT, None)
+		listener.connect('incoming', on_incoming)
+		listener.start()
+		app._listener = listener
+		logger.info('Service listening on %s', Config.SOCKET_PATH)
+
+	app.connect('activate', on_activate)
+	try:
+		return app.run(None)
+	finally:
+		if os.path.exists(Config.SOCKET_PATH): os.unlink(Config.SOCKET_PATH)
@@ -0,0 +1,105 @@
+import collections
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import gi
+gi.require_version('Gtk', '4.0')
+
+from gi.repository import GLib
+from .Annotations import Event, run_until_complete
+
+logger = logging.getLogger('Shard')
+
+# Minimum number of shards per process (shards differ in size, the pool balances them)
+SHARDS_PER_PROCESS = 4
+
+# Prepare directories (shards of a batch) in worker processes; results are handed out in submission order
+# Groups and roots never span directories, so the shards are independent of each other
+class ShardPool:
+	def __init__(self, uris, properties, processes):
+		# Fresh interpreters: forking would copy the GLib main loop and threads of the parent
+		context = multiprocessing.get_context('spawn')
+		context.set_executable(get_python())
+		self._executor = concurrent.futures.ProcessPoolExecutor(max_workers = processes, mp_context = context)
+		self._pending = collections.deque()
+		self._event = Event()
+		for uri in uris:
+			future = self._executor.submit(prepare_shard, uri, properties)
+			future.add_done_callback(self.on_done)
+			self._pending.append((uri, future))
+
+	# Wake up the main loop when a shard finished (events are not thread-safe)
+	def on_done(self, future):
+		GLib.idle_add(self.wake)
+
+	def wake(self):
+		self._event.set()
+		return False
+
+	# Check whether shards are left
+	def has_pending(self):
+		return len(self._pending) > 0
+
+	# Get (uri, result) of the next shard if it finished, None otherwise; exceptions of the shard are raised here
+	def get_ready(self):
+		if len(self._pending) == 0 or not self._pending[0][1].done(): return None
+		uri, future = self._pending.popleft()
+		return uri, future.result()
+
+	# Get event set by the next finished shard; check get_ready() again after getting it
+	def get_event(self):
+		if self._event.is_set(): self._event = Event()
+		return self._event
+
+	# Stop preparing shards without waiting for running shards (e.g. the user cancelled the prepare)
+	def close(self):
+		# Private, but the executor cannot stop running calls otherwise (terminate_workers needs python 3.14)
+		processes = list((self._executor._processes or {}).values()) if self.has_pending() else []
+		self._executor.shutdown(wait = False, cancel_futures = True)
+		for process in processes:
+			if process.is_alive(): process.terminate()
+		self._pending.clear()
+
+# Get Python interpreter for worker processes; None if there is none (spawn starts sys.executable, which is the
+# host program when embedded, e.g. nautilus)
+def get_python():
+	if Config.PYTHON is not None: return Config.PYTHON
+	if os.path.basename(sys.executable or '').startswith('python'): return sys.executable
+	return shutil.which('python%d.%d' % sys.version_info[:2])
+
+# Prepare directory in a worker process; returns compact results (see Batch.get_shard_result)
+# The batch of the parent process writes the report and trace of the whole prepare
+def prepare_shard(uri, properties):
+	properties = dict(properties, processes = 0, pipeline = False, profile = False, report = False)
+	batch = Batch.Batch([uri])
+	batch.init(properties, ConsoleProgress.ConsoleProgress(None))
+	run_until_complete(batch.prepare())
+	return batch.get_shard_result()
+
+# Get file properties differing from the defaults of its extension, to be sent to another process
+# defaults: extension -> default properties, filled on demand; files of a group conversion are replaced by their uris
+def encode_properties(file, defaults):
+	extension = file.get_extension().lower()
+	if extension not in defaults:
+		default = File.File(file._batch, file.get_uri())
+		default.set_default_properties(file._batch._command == 'postprocess')
+		defaults[extension] = default._properties
+	properties = dict([(key, value) for key, value in file._properties.items() if key not in defaults[extension] or defaults[extension][key] != value])
+	if isinstance(properties.get(File.GROUPCONVERT, None), list):
+		properties[File.GROUPCONVERT] = [f.get_uri() for f in properties[File.GROUPCONVERT]]
+	return properties
+
+# Restore file properties of encode_properties for files of batch (to be added to the default properties)
+def decode_properties(batch, properties):
+	if isinstance(properties.get(File.GROUPCONVERT, None), list):
+		properties = dict(properties)
+		properties[File.GROUPCONVERT] = [batch.get_file(uri) for uri in properties[File.GROUPCONVERT]]
+	return properties
+
+from . import Batch
+from . import Config
+from . import ConsoleProgress
+from . import File
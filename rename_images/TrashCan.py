@@ -0,0 +1,155 @@
+import datetime
+import logging
+import os
+import stat
+import urllib.parse
+
+logger = logging.getLogger('TrashCan')
+
+# Trash directory following the freedesktop.org trash specification (files/ and info/ subdirectories)
+# topdir: directory paths in .trashinfo files are relative to (None: absolute paths, used for the home trash)
+class TrashDirectory:
+	def __init__(self, path, topdir = None):
+		self.path = path
+		self.topdir = topdir
+		self._files = os.path.join(path, 'files')
+		self._info = os.path.join(path, 'info')
+
+	# Display nicely on print
+	def __str__(self):
+		return self.path
+
+	# Create directory structure if necessary; returns False if the trash cannot be used
+	def prepare(self):
+		try:
+			for path in [self.path, self._files, self._info]:
+				os.makedirs(path, mode = 0o700, exist_ok = True)
+		except OSError as e:
+			logger.warn('Trash %s not usable: %s', self.path, e)
+			return False
+		return True
+
+	# Get path as stored in .trashinfo
+	def get_info_path(self, path):
+		if self.topdir is not None: path = os.path.relpath(path, self.topdir)
+		return urllib.parse.quote(path)
+
+	# Reserve a unique name by creating its .trashinfo file; returns the name
+	def write_info(self, path, deletion_date):
+		base = os.path.basename(path)
+		name = base
+		counter = 1
+		while True:
+			try:
+				fd = os.open(os.path.join(self._info, name + '.trashinfo'), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+				break
+			except FileExistsError:
+				counter += 1
+				root, ext = os.path.splitext(base)
+				name = '%s.%d%s' % (root, counter, ext)
+		with os.fdopen(fd, 'w') as f:
+			f.write('[Trash Info]\nPath=%s\nDeletionDate=%s\n' % (self.get_info_path(path), deletion_date))
+		return name
+
+	# Remove .trashinfo of a name (file could not be moved)
+	def remove_info(self, name):
+		try:
+			os.unlink(os.path.join(self._info, name + '.trashinfo'))
+		except OSError:
+			pass
+
+	# Move file to the trash under a reserved name
+	def move(self, path, name):
+		os.rename(path, os.path.join(self._files, name))
+
+	# Flush the .trashinfo files written so far to disk
+	def sync(self):
+		try:
+			fd = os.open(self._info, os.O_RDONLY | os.O_DIRECTORY)
+			try:
+				os.fsync(fd)
+			finally:
+				os.close(fd)
+		except OSError:
+			pass
+
+# Get mount point containing path
+def get_mount_point(path):
+	path = os.path.realpath(path)
+	while not os.path.ismount(path):
+		path = os.path.dirname(path)
+	return path
+
+# Get the user's home trash
+def get_home_trash():
+	data = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+	return TrashDirectory(os.path.join(data, 'Trash'))
+
+# Get trash directory for files on the device of path (None: no trash available, e.g. read-only mount)
+def get_trash_directory(path):
+	home = get_home_trash()
+	device = os.stat(path).st_dev
+	try:
+		# The home trash (or the directory it will be created in) is on the same device
+		existing = home.path
+		while not os.path.exists(existing): existing = os.path.dirname(existing)
+		if os.stat(existing).st_dev == device: return home if home.prepare() else None
+	except OSError:
+		pass
+	topdir = get_mount_point(path)
+	uid = os.getuid()
+	# $topdir/.Trash/$uid if the administrator provided a sticky, non-symlink .Trash directory
+	shared = os.path.join(topdir, '.Trash')
+	try:
+		info = os.lstat(shared)
+		if stat.S_ISDIR(info.st_mode) and info.st_mode & stat.S_ISVTX:
+			trash = TrashDirectory(os.path.join(shared, str(uid)), topdir)
+			if trash.prepare(): return trash
+		else:
+			logger.warn('Ignoring %s: not a sticky directory', shared)
+	except OSError:
+		pass
+	# $topdir/.Trash-$uid otherwise
+	trash = TrashDirectory(os.path.join(topdir, '.Trash-%d' % uid), topdir)
+	if trash.prepare(): return trash
+	return None
+
+# Move paths (all on one device) to the trash in bulk: all .trashinfo files are written first, then the files are renamed
+# Generator yielding (path, error) per path once handled (error is None on success)
+# delete_if_not_supported: delete the files if there is no usable trash on their device
+def trash_paths(paths, delete_if_not_supported):
+	if len(paths) == 0: return
+	try:
+		trash = get_trash_directory(paths[0])
+	except OSError as e:
+		for path in paths: yield (path, str(e))
+		return
+	if trash is None:
+		for path in paths:
+			if not delete_if_not_supported:
+				yield (path, 'Trash not supported')
+				continue
+			logger.warn('Trashing %s not supported, deleting it', path)
+			try:
+				os.unlink(path)
+				yield (path, None)
+			except OSError as e:
+				yield (path, str(e))
+		return
+	logger.info('Trashing %d files to %s', len(paths), trash)
+	deletion_date = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+	names = {}
+	for path in paths:
+		try:
+			names[path] = trash.write_info(os.path.abspath(path), deletion_date)
+		except OSError as e:
+			yield (path, str(e))
+	trash.sync()
+	for path, name in names.items():
+		try:
+			trash.move(path, name)
+		except OSError as e:
+			trash.remove_info(name)
+			yield (path, str(e))
+			continue
+		yield (path, None)
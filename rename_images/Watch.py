@@ -0,0 +1,224 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import time
+
+from gi.repository import GObject, GLib
+from .Annotations import Event, run_until_complete, trace
+
+logger = logging.getLogger('Watch')
+
+# inotify event masks (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+# Complete files written or moved into a directory; new directories (e.g. a copied camera dump)
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+# Minimal inotify binding
+class Inotify:
+	def __init__(self):
+		self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+		self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self.fd < 0:
+			error = ctypes.get_errno()
+			raise OSError(error, 'inotify_init1: %s' % os.strerror(error))
+		self._watches = {}
+
+	# Watch directory (not recursive)
+	def add_watch(self, path):
+		wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+		if wd < 0:
+			error = ctypes.get_errno()
+			raise OSError(error, 'inotify_add_watch %s: %s' % (path, os.strerror(error)))
+		self._watches[wd] = path
+
+	# Get all watched directories
+	def get_directories(self):
+		return list(self._watches.values())
+
+	# Read pending events; returns list of (path, mask), path is None for queue overflows
+	def read_events(self):
+		events = []
+		while True:
+			try:
+				data = os.read(self.fd, 65536)
+			except BlockingIOError:
+				break
+			offset = 0
+			while offset < len(data):
+				wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+				offset += EVENT_HEADER.size
+				name = data[offset:offset + length].rstrip(b'\0')
+				offset += length
+				if mask & IN_Q_OVERFLOW:
+					events.append((None, mask))
+				elif mask & IN_IGNORED:
+					self._watches.pop(wd, None)
+				elif wd in self._watches:
+					events.append((os.path.join(self._watches[wd], os.fsdecode(name)), mask))
+		return events
+
+	def close(self):
+		os.close(self.fd)
+
+# Watch directories and postprocess files once their directory did not change for a while
+# Only groups with new files (and their siblings in the same directory) are processed
+class Watcher(GObject.GObject):
+	def __init__(self, directories, properties, progress, settle = None):
+		GObject.GObject.__init__(self)
+		self._properties = properties
+		self._progress = progress
+		self._settle = settle if settle is not None else Config.WATCH_SETTLE
+		self._inotify = Inotify()
+		self._changes = {}
+		# (directory, groups) of the running batch, whose own writes must not trigger it again
+		self._writing = None
+		self._event = Event()
+		for directory in directories: self.add_directory(directory)
+		GLib.io_add_watch(self._inotify.fd, GLib.PRIORITY_DEFAULT, GLib.IOCondition.IN, self.on_inotify)
+
+	# Watch directory recursively; returns files already in it
+	def add_directory(self, directory):
+		files = []
+		for root, directories, names in os.walk(directory):
+			try:
+				self._inotify.add_watch(root)
+			except OSError as e:
+				logger.warn('Not watching %s: %s', root, e)
+			files += [os.path.join(root, name) for name in names]
+		return files
+
+	# Record changed file of its directory
+	def add_change(self, path):
+		if os.path.splitext(path)[1].lower() not in File.EXTENSIONS: return
+		directory = os.path.dirname(path)
+		if self._writing is not None and directory == self._writing[0] and get_group_name(os.path.basename(path)) in self._writing[1]: return
+		if directory not in self._changes: self._changes[directory] = [set(), 0]
+		self._changes[directory][0].add(os.path.basename(path))
+		self._changes[directory][1] = time.monotonic()
+
+	# Collect changes reported by inotify
+	def on_inotify(self, fd, condition):
+		for path, mask in self._inotify.read_events():
+			if path is None:
+				logger.warn('inotify queue overflow, rescanning all directories')
+				for directory in self._inotify.get_directories():
+					for name in os.listdir(directory): self.add_change(os.path.join(directory, name))
+			elif mask & IN_ISDIR:
+				# New directory: watch it and process what was copied into it before the watch existed
+				if mask & (IN_CREATE | IN_MOVED_TO):
+					for file in self.add_directory(path): self.add_change(file)
+			elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+				self.add_change(path)
+		self._event.set()
+		return True
+
+	# Get directory whose changes settled (None if there is none) and seconds until the next one settles
+	def get_settled(self):
+		now = time.monotonic()
+		wait = None
+		for directory, (names, changed) in self._changes.items():
+			remaining = changed + self._settle - now
+			if remaining <= 0: return directory, 0
+			if wait is None or remaining < wait: wait = remaining
+		return None, wait
+
+	# Get files of directory belonging to the same groups as the changed files
+	def get_group_files(self, directory, names):
+		groups = set([get_group_name(name) for name in names])
+		try:
+			entries = os.listdir(directory)
+		except OSError as e:
+			logger.warn('Cannot list %s: %s', directory, e)
+			return []
+		return sorted([os.path.join(directory, name) for name in entries if get_group_name(name) in groups and os.path.splitext(name)[1].lower() in File.EXTENSIONS])
+
+	# Replace destructive default actions (e.g. trashing single RAW files) by Ignore since nobody reviews them
+	def disarm(self, batch):
+		for check, roots in batch._file_actions.items():
+			for files in roots.values():
+				for file in files:
+					action = file.get_property(check)
+					if action is None or not action.is_destructive(): continue
+					logger.warn('Not running "%s" for %s in watch mode, postprocess it interactively', action.get_text(file), file.get_path())
+					file.add_properties({check: FileAction.Ignore})
+
+	# Run checks and non-destructive default actions for the changed groups of directory
+	@trace
+	def process(self, directory, names):
+		paths = self.get_group_files(directory, names)
+		if len(paths) == 0: return
+		logger.info('Processing %d files in %s', len(paths), directory)
+		batch = Batch.Batch(paths)
+		batch.init(dict(self._properties), self._progress)
+		# Actions and metadata saves write files of these groups (results of conversions belong to them, too)
+		self._writing = (directory, set([get_group_name(os.path.basename(path)) for path in paths]))
+		try:
+			for phase in [batch.prepare, batch.execute]:
+				# The actions are known once prepare finished
+				if phase == batch.execute: self.disarm(batch)
+				# TODO: Better use (supported from python 3.3): yield from ...
+				generator = phase()
+				message = None
+				while True:
+					try:
+						item = generator.send(message)
+						message = yield item
+					except StopIteration:
+						break
+		finally:
+			# Drop events of the batch's own writes which are still queued
+			self.on_inotify(self._inotify.fd, None)
+			self._writing = None
+
+	# Process settled directories forever
+	@trace
+	def run(self):
+		while True:
+			directory, wait = self.get_settled()
+			if directory is None:
+				if self._event.is_set(): self._event = Event()
+				yield self._event if wait is None else Event.any(self._event, Event.timeout(int(wait * 1000) + 1))
+				continue
+			names = self._changes.pop(directory)[0]
+			try:
+				for item in self.process(directory, names): yield item
+			except Exception as e:
+				# Keep watching; the files are processed again when they change
+				logger.error('Processing %s failed: %s', directory, e)
+
+	def close(self):
+		self._inotify.close()
+
+# Get name of the file group (as Batch groups files with subgroups)
+def get_group_name(name):
+	match = Batch.GROUP_PATTERN.match(name)
+	if match: return match.group('group')
+	return os.path.splitext(name)[0]
+
+# Watch directories with properties until interrupted
+def watch(directories, properties):
+	watcher = Watcher(directories, properties, ConsoleProgress.ConsoleProgress())
+	logger.info('Watching %s (settle time %ds)', ', '.join(directories), watcher._settle)
+	try:
+		run_until_complete(watcher.run())
+	except KeyboardInterrupt:
+		pass
+	finally:
+		watcher.close()
+	return 0
+
+from . import Batch
+from . import Config
+from . import ConsoleProgress
+from . import File
+from . import FileAction
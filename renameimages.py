@@ -3,4 +3,6 @@
 from __future__ import with_statement
 from rename_images import CommandLine
 
-CommandLine.main()
+# Guarded since worker processes (see rename_images.Shard) import the main module
+if __name__ == '__main__':
+	CommandLine.main()
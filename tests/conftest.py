@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+# Tests need PyGObject with Gtk 4 and GExiv2 0.10 (like the extension); they are not collected without them
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+collect_ignore_glob = []
+try:
+	import gi
+	gi.require_version('Gtk', '4.0')
+	gi.require_version('GExiv2', '0.10')
+except (ImportError, ValueError) as e:
+	sys.stderr.write('Skipping tests, PyGObject with Gtk 4 and GExiv2 0.10 is missing: %s\n' % e)
+	collect_ignore_glob.append('test_*.py')
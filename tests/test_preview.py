@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from gi.repository import Gtk
+
+from rename_images import File, FileActionWindow
+
+# Batch providing what the preview rows need
+class PreviewBatch:
+	def get_relative_path(self, file):
+		return file.get_uri().rsplit('/', 1)[-1]
+
+# Every row of the preview fits the columns of its store (including the thumbnail)
+def test_fill_preview_store():
+	batch = PreviewBatch()
+	store = Gtk.ListStore(*FileActionWindow.get_preview_columns())
+	for index in range(3):
+		file = File.File(batch, 'file:///tmp/IMG_%04d.jpg' % index)
+		file._creation_time = datetime.datetime(2024, 5, 1, 12, 0, index)
+		store.append(FileActionWindow.get_preview_row(batch, file))
+	assert len(store) == 3
+	iter = store.get_iter_first()
+	assert store.get_value(iter, 1) == 'IMG_0000.jpg'
+	assert store.get_value(iter, 5) is None
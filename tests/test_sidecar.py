@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from rename_images import Batch, ConsoleProgress, File, FileGroup, Mode
+
+# Batch with IMG_0001.cr2 and IMG_0001.nef sharing IMG_0001.xmp, renamed to the given names (without extension)
+def create_batch(directory, cr2_name, nef_name):
+	for name in ['IMG_0001.cr2', 'IMG_0001.nef', 'IMG_0001.xmp']:
+		with open(os.path.join(directory, name), 'w'): pass
+	batch = Batch.Batch([str(directory)])
+	batch.init(dict(Mode.GROUP), ConsoleProgress.ConsoleProgress(None))
+	files = []
+	for name, destination in [('IMG_0001.cr2', cr2_name + '.cr2'), ('IMG_0001.nef', nef_name + '.nef')]:
+		file = File.File(batch, 'file://' + os.path.join(str(directory), name))
+		file.set_default_properties(False)
+		file.get_destination_uri = lambda destination = destination: 'file://' + os.path.join(str(directory), destination)
+		files.append(file)
+	group = FileGroup.FileGroup(files[0])
+	group.add_file(files[1])
+	batch._files_by_group = {group._group: group}
+	batch._file_actions = {}
+	return batch, files
+
+# Files renamed alike share their sidecar, the first of them moves it
+def test_shared_sidecar_follows_files(tmp_path):
+	batch, (cr2, nef) = create_batch(tmp_path, 'Trip', 'Trip')
+	assert cr2.get_sidecar_owner() is cr2 and nef.get_sidecar_owner() is cr2
+	assert nef.get_sidecar_destination_uri() is None
+	order = [file for file in batch.calculate_rename_order() if file is not None]
+	assert sorted([file.get_uri() for file in order]) == sorted([cr2.get_uri(), nef.get_uri()])
+	for file in order: file.rename()
+	assert sorted(os.listdir(str(tmp_path))) == ['Trip.cr2', 'Trip.nef', 'Trip.xmp']
+
+# Files renamed differently cannot both keep the shared sidecar
+def test_shared_sidecar_renamed_differently(tmp_path):
+	batch, (cr2, nef) = create_batch(tmp_path, 'Trip', 'Other')
+	with pytest.raises(Exception):
+		for file in batch.calculate_rename_order(): pass
+	assert cr2.get_property(File.RENAMEERROR) is None
+	assert 'shared' in nef.get_property(File.RENAMEERROR)